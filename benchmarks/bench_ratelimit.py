@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark rate limiter: checks per detik dengan 100k user.
+Run: python benchmarks/bench_ratelimit.py [jumlah_user] [jumlah_check]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ratelimit import RateLimiter
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_checks = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+
+    path = os.path.join(tempfile.mkdtemp(), "users.json")
+    limiter = RateLimiter(limit=30, window=1800, path=path)
+
+    # Warm up: semua user sudah punya bucket
+    start = time.perf_counter()
+    for uid in range(n_users):
+        limiter.check(uid)
+    warm = time.perf_counter() - start
+
+    uids = [random.randrange(n_users) for _ in range(n_checks)]
+    start = time.perf_counter()
+    for uid in uids:
+        limiter.check(uid, "user")
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    limiter.snapshot()
+    snap = time.perf_counter() - start
+
+    start = time.perf_counter()
+    limiter.load()
+    load = time.perf_counter() - start
+
+    print(f"Users            : {n_users:,}")
+    print(f"Warm-up          : {n_users / warm:,.0f} checks/s (new users)")
+    print(f"Hot checks       : {n_checks / elapsed:,.0f} checks/s ({elapsed / n_checks * 1e6:.2f} us/check)")
+    print(f"Snapshot         : {snap * 1000:.1f} ms ({os.path.getsize(path) / 1024:.0f} KB)")
+    print(f"Load             : {load * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Fake server Ollama untuk test lokal tanpa GPU/model (stdlib saja).
+Meniru /api/chat dan /api/generate dengan streaming NDJSON.
+
+Run: python benchmarks/fake_ollama.py [port] [jumlah_token] [delay_per_token_detik]
+Lalu jalankan bot dengan OLLAMA_URL=http://localhost:<port>.
+"""
+import sys
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+N_TOKENS = 20
+TOKEN_DELAY = 0.05
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, sama seperti Ollama asli
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path not in ("/api/chat", "/api/generate"):
+            self.send_error(404)
+            return
+        if payload.get("model") == "missing":
+            self._send_json(404, {"error": "model 'missing' not found"})
+            return
+
+        chat = self.path == "/api/chat"
+        words = [f"kata{i} " for i in range(N_TOKENS)]
+        if not payload.get("stream", True):
+            text = "".join(words)
+            body = {"model": payload.get("model"), "done": True}
+            body.update({"message": {"role": "assistant", "content": text}} if chat else {"response": text})
+            self._send_json(200, body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for word in words:
+            time.sleep(TOKEN_DELAY)
+            line = {"model": payload.get("model"), "done": False}
+            line.update({"message": {"role": "assistant", "content": word}} if chat else {"response": word})
+            self._chunk(json.dumps(line) + "\n")
+        self._chunk(json.dumps({"model": payload.get("model"), "done": True}) + "\n")
+        self._chunk("")
+
+    def _chunk(self, text: str):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve(port: int = 11434, n_tokens: int = N_TOKENS, token_delay: float = TOKEN_DELAY):
+    global N_TOKENS, TOKEN_DELAY
+    N_TOKENS, TOKEN_DELAY = n_tokens, token_delay
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllama)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 11434
+    n_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else N_TOKENS
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else TOKEN_DELAY
+    server = serve(port, n_tokens, delay)
+    print(f"🦙 Fake Ollama listening on http://127.0.0.1:{port} ({n_tokens} token, {delay}s/token)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Load test offline untuk bot-groq.py: handler asli (anu_cmd, handle, filter,
+storage, router LLM, formatting) dijalankan melawan stand-in lokal:
+
+- Bot API palsu: BaseRequest PTB yang menjawab sendMessage/editMessageText/... di memori
+- Stub OpenAI-compatible: stream SSE lewat httpx.MockTransport (latency bisa diatur)
+- Search palsu: pengganti DDGS dengan hasil sintetis
+- Storage in-memory: pengganti client Supabase
+
+Update sintetis (chat private, mention di grup, reply, mode campur) dikirim
+ke update_queue dengan rate tetap (open loop). Output: updates/s yang
+sustained, persentil latency end-to-end, lag event loop, dan ringkasan metrics per tahap.
+
+Run: python benchmarks/loadtest.py --rate 50 --duration 20 [--concurrent 64] [--json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import tempfile
+import importlib.util
+from collections import Counter, defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import httpx
+from openai import AsyncOpenAI
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+BOT_ID = 1
+BOT_USERNAME = "loadtest_bot"
+PROMPTS = [
+    "jelaskan cara kerja async di python",
+    "buatkan puisi tentang hujan",
+    "apa bedanya list dan tuple",
+    "kasih tips belajar bahasa inggris",
+    "ringkas sejarah internet",
+]
+QUERIES = ["berita teknologi hari ini", "harga iphone terbaru", "jadwal timnas", "cuaca jakarta"]
+KINDS = {"anu": 0.4, "informasi": 0.15, "mention": 0.25, "reply": 0.1, "noise": 0.1}
+
+
+def load_bot():
+    """Import bot-groq.py (nama file pakai '-') dengan env aman untuk offline."""
+    os.environ.setdefault("TOKEN", "123456:LOADTEST")
+    os.environ["SUPABASE_URL"] = ""  # jangan connect ke Supabase asli
+    os.environ.setdefault("GROQ_API_KEY", "loadtest")
+    spec = importlib.util.spec_from_file_location("bot_groq", os.path.join(ROOT, "bot-groq.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+# --- Bot API palsu ---
+class FakeBotAPI(BaseRequest):
+    """Jawab request Bot API di memori dengan latency tetap."""
+
+    def __init__(self, latency: float = 0.03):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 1000
+
+    @property
+    def read_timeout(self):
+        return 5.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "Load", "username": BOT_USERNAME}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            if endpoint == "sendMessage":
+                self._message_id += 1
+                message_id = self._message_id
+            else:
+                message_id = int(params.get("message_id", 0))
+            result = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Load", "username": BOT_USERNAME},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# --- Stub OpenAI-compatible (SSE streaming) ---
+class FakeLLM:
+    def __init__(self, ttft: float = 0.3, tokens: int = 60, token_delay: float = 0.01):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.requests = Counter()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        model = body.get("model", "")
+        self.requests[model] += 1
+
+        async def sse():
+            await asyncio.sleep(self.ttft)
+            for i in range(self.tokens):
+                chunk = {
+                    "id": "loadtest", "object": "chat.completion.chunk", "created": 0, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": f"kata{i} "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=sse())
+
+    def client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key="loadtest",
+            base_url="http://llm.invalid/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handler)),
+        )
+
+
+# --- Search palsu (pengganti DDGS, dipanggil dari thread) ---
+def make_fake_ddgs(latency: float):
+    class FakeDDGS:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def news(self, query, max_results=10, **kwargs):
+            time.sleep(latency / 2)
+            return [
+                {"title": f"{query} berita {i}", "body": f"Isi berita {i} tentang {query}.",
+                 "url": f"https://news.example/{i}", "date": "2026-01-01"}
+                for i in range(max_results)
+            ]
+
+        def text(self, query, max_results=15, **kwargs):
+            time.sleep(latency / 2)
+            return [
+                {"title": f"{query} hasil {i}", "body": f"Penjelasan {i} soal {query} " * 5,
+                 "href": f"https://web.example/{i}"}
+                for i in range(max_results)
+            ]
+
+    return FakeDDGS
+
+
+# --- Storage in-memory (pengganti client Supabase) ---
+PRIMARY_KEYS = {"conversations": "user_id", "groups": "chat_id", "bot_settings": "key"}
+
+
+class _Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, db: dict, name: str):
+        self.db = db
+        self.rows = db.setdefault(name, {})
+        self.key = PRIMARY_KEYS.get(name, "id")
+        self.filters = []
+        self._order = None
+        self._desc = False
+        self._limit = None
+        self._range = None
+        self.payload = None
+        self.action = "select"
+
+    def select(self, *args):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda r: r.get(column) is not None and r.get(column) > value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda r: r.get(column) is not None and r.get(column) < value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def order(self, column, desc: bool = False, **kwargs):
+        self._order = column
+        self._desc = desc
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.action = "upsert"
+        self.payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.action = "insert"
+        self.payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def delete(self, **kwargs):
+        self.action = "delete"
+        return self
+
+    def execute(self):
+        if self.action == "upsert":
+            for row in self.payload:
+                # Seperti PostgREST: kolom yang tidak dikirim tetap
+                self.rows.setdefault(row[self.key], {}).update(row)
+            return _Result(self.payload)
+        if self.action == "insert":
+            for row in self.payload:
+                self.db["_serial"] = self.db.get("_serial", 0) + 1
+                self.rows[self.db["_serial"]] = dict(row, id=self.db["_serial"])
+            return _Result(self.payload)
+        if self.action == "delete":
+            keys = [k for k, r in self.rows.items() if all(f(r) for f in self.filters)]
+            for k in keys:
+                del self.rows[k]
+            return _Result([], count=len(keys))
+        rows = [dict(r) for r in self.rows.values() if all(f(r) for f in self.filters)]
+        if self._order:
+            rows.sort(key=lambda r: r.get(self._order), reverse=self._desc)
+        if self._range:
+            rows = rows[self._range[0]:self._range[1] + 1]
+        if self._limit:
+            rows = rows[:self._limit]
+        return _Result(rows)
+
+
+class MemorySupabase:
+    def __init__(self):
+        self.db = {}
+
+    def table(self, name: str):
+        return _Query(self.db, name)
+
+
+# --- Generator update sintetis ---
+class UpdateFactory:
+    def __init__(self, n_users: int, n_groups: int, seed: int = 1):
+        self.rng = random.Random(seed)
+        self.n_users = n_users
+        self.n_groups = n_groups
+        self.update_id = 0
+        self.kinds = list(KINDS)
+        self.weights = list(KINDS.values())
+
+    def make(self) -> tuple:
+        rng = self.rng
+        self.update_id += 1
+        kind = rng.choices(self.kinds, self.weights)[0]
+        uid = rng.randrange(1, self.n_users + 1)
+        user = {"id": uid, "is_bot": False, "first_name": f"User{uid}", "username": f"user{uid}"}
+        private = {"id": uid, "type": "private", "first_name": user["first_name"]}
+        gid = -1000000000 - rng.randrange(self.n_groups)
+        group = {"id": gid, "type": "supergroup", "title": f"Grup {-gid % 1000}"}
+        prompt = rng.choice(PROMPTS)
+
+        message = {"message_id": self.update_id, "date": int(time.time()), "from": user}
+        if kind == "anu":
+            mode = "halus" if uid % 2 else "kasar"  # mode tetap per user (tidak bentrok)
+            message.update(chat=private, text=f"/anu {mode} {prompt}")
+        elif kind == "informasi":
+            message.update(chat=private, text=f"/anu informasi {rng.choice(QUERIES)}")
+        elif kind == "mention":
+            message.update(chat=group, text=f"@{BOT_USERNAME} {prompt}")
+        elif kind == "reply":
+            message.update(chat=group, text=prompt, reply_to_message={
+                "message_id": 1, "date": int(time.time()), "chat": group,
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Load", "username": BOT_USERNAME},
+                "text": "jawaban sebelumnya",
+            })
+        else:
+            message.update(chat=group, text=prompt)  # Obrolan grup biasa (harus difilter)
+        if message["text"].startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": 4}]
+        return kind, {"update_id": self.update_id, "message": message}
+
+
+# --- Lag event loop ---
+async def monitor_loop_lag(samples: list, interval: float = 0.05):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.chdir(workdir)  # users.json / groups.json dll ditulis di sini, bukan di repo
+    bg = load_bot()
+
+    # Pasang stand-in
+    bg.supabase = MemorySupabase()
+    bg.DDGS = make_fake_ddgs(args.search_latency)
+    fake_llm = FakeLLM(args.llm_ttft, args.llm_tokens, args.llm_token_delay)
+    llm_client = fake_llm.client()
+    for routes in bg.llm_router.table.values():
+        for route in routes:
+            if route.provider.name == "groq":
+                route.provider.client = llm_client
+
+    api = FakeBotAPI(args.tg_latency)
+    builder = (
+        Application.builder().token(os.environ["TOKEN"]).request(api).get_updates_request(api)
+        .concurrent_updates(args.concurrent or bg.UPDATE_CONCURRENCY)
+    )
+    app = bg.register_handlers(builder.build())
+
+    sent = {}  # update_id -> (kind, waktu enqueue)
+    latencies = defaultdict(list)
+    finished = asyncio.Event()
+
+    async def mark_done(update: Update, context):
+        kind, enqueued = sent[update.update_id]
+        latencies[kind].append(time.perf_counter() - enqueued)
+        if sum(len(v) for v in latencies.values()) == len(sent) and producer_done:
+            finished.set()
+
+    app.add_handler(TypeHandler(Update, mark_done), group=1)  # Jalan setelah handler utama selesai
+
+    await app.initialize()
+    bg.addressed_to_bot.load_identity(app.bot)
+    await app.start()
+
+    lag = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag))
+    factory = UpdateFactory(args.users, args.groups, args.seed)
+    producer_done = False
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for i in range(total):
+        # Open loop: jadwal kirim tetap, tidak menunggu update sebelumnya selesai
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind, data = factory.make()
+        sent[data["update_id"]] = (kind, time.perf_counter())
+        await app.update_queue.put(Update.de_json(data, app.bot))
+    producer_done = True
+    if sum(len(v) for v in latencies.values()) == len(sent):
+        finished.set()
+
+    try:
+        await asyncio.wait_for(finished.wait(), timeout=args.drain)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+    lag_task.cancel()
+    await app.stop()
+    await app.shutdown()
+    await llm_client.close()
+    bg.storage.shutdown()
+
+    all_latencies = [x for v in latencies.values() for x in v]
+    done = len(all_latencies)
+    return {
+        "config": vars(args),
+        "sent": total,
+        "completed": done,
+        "elapsed_s": round(elapsed, 2),
+        "updates_per_s": round(done / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            kind: {p: round(percentile(v, q) * 1000, 1) for p, q in (("p50", 50), ("p90", 90), ("p99", 99))}
+            | {"max": round(max(v) * 1000, 1), "n": len(v)}
+            for kind, v in sorted(latencies.items()) if v
+        } | ({"all": {
+            "p50": round(percentile(all_latencies, 50) * 1000, 1),
+            "p90": round(percentile(all_latencies, 90) * 1000, 1),
+            "p99": round(percentile(all_latencies, 99) * 1000, 1),
+            "max": round(max(all_latencies) * 1000, 1),
+            "n": done,
+        }} if all_latencies else {}),
+        "loop_lag_ms": {
+            "p50": round(percentile(lag, 50) * 1000, 2),
+            "p99": round(percentile(lag, 99) * 1000, 2),
+            "max": round(max(lag) * 1000, 2) if lag else 0.0,
+        },
+        "bot_api_calls": dict(api.calls),
+        "llm_requests": dict(fake_llm.requests),
+        "stages": bg.metrics.REGISTRY.summary_lines(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test offline bot-groq.py")
+    parser.add_argument("--rate", type=float, default=20, help="update per detik")
+    parser.add_argument("--duration", type=float, default=15, help="lama kirim update (detik)")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--concurrent", type=int, default=0,
+                        help="concurrent_updates PTB (0 = UPDATE_CONCURRENCY produksi, 1 = sekuensial)")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="detik sampai token pertama")
+    parser.add_argument("--llm-tokens", type=int, default=60)
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--tg-latency", type=float, default=0.03, help="latency Bot API palsu")
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--drain", type=float, default=120, help="maksimal tunggu antrian habis")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="output JSON (untuk CI)")
+    args = parser.parse_args()
+
+    # Mode JSON: log bot (print) dialihkan ke stderr supaya stdout berisi JSON saja
+    with contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext():
+        result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"\nUpdates      : {result['completed']}/{result['sent']} selesai dalam {result['elapsed_s']}s")
+    print(f"Throughput   : {result['updates_per_s']} updates/s (sustained)")
+    print("Latency (ms) :")
+    for kind, stats in result["latency_ms"].items():
+        print(f"  {kind:<10} n={stats['n']:<5} p50={stats['p50']:<8} p90={stats['p90']:<8} "
+              f"p99={stats['p99']:<8} max={stats['max']}")
+    lag = result["loop_lag_ms"]
+    print(f"Loop lag (ms): p50={lag['p50']} p99={lag['p99']} max={lag['max']}")
+    print(f"Bot API      : {result['bot_api_calls']}")
+    print(f"LLM          : {result['llm_requests']}")
+    print("Stages       :")
+    for line in result["stages"]:
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,6 @@
 #!/usr/bin/env python3
 
 import os
-import json
-import time
-import threading
-import google.generativeai as genai
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -13,63 +9,31 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
+from ratelimit import RateLimiter
+from bot_filters import addressed_to_bot
+from llm_providers import GeminiProvider
+from streaming import stream_chunks_to_message
+import webhook
 
 # --- Gemini ---
-genai.configure(api_key=os.getenv("GEMINI_API_KEY", "your-api-key"))
-MODEL = "gemini-1.5-flash" # or "gemini-1.5-pro"
+MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash") # or "gemini-1.5-pro"
+MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "1024")) # You can change this
+gemini = GeminiProvider(api_key=os.getenv("GEMINI_API_KEY", "your-api-key"))
+gemini.model(MODEL)  # GenerativeModel dibuat sekali di sini, lalu di-reuse tiap prompt
 
 ADMIN = os.getenv("ADMIN", "@GustyxPower") # your username
 TOKEN = os.getenv("GEMINI_TOKEN", "your-bot-token")
 DATA_FILE = "users.json"
 
-# --- persist user data ---
-lock = threading.Lock()
-
-def load():
-    with lock:
-        try:
-            return json.load(open(DATA_FILE))
-        except FileNotFoundError:
-            return {}
-
-def save(data):
-    with lock:
-        json.dump(data, open(DATA_FILE, "w"), indent=2)
+# --- rate limit (in-memory token bucket, snapshot periodik ke DATA_FILE) ---
+limiter = RateLimiter(limit=30, window=1800, path=DATA_FILE, admin=ADMIN) # you can change limit this
 
 def can_use(uid, name):
-    data = load()
-    now = time.time()
-
-    if str(uid) not in data:
-        data[str(uid)] = {"count": 0, "reset": now + 1800, "premium": False}
-    u = data[str(uid)]
-
-    if now > u["reset"]:
-        u["count"] = 0
-        u["reset"] = now + 1800
-
-    if name == ADMIN:
-        u["premium"] = True
-
-    if u["premium"]:
-        save(data)
-        return True, u["count"]
-
-    if u["count"] >= 30: # you can change limit this
-        save(data)
-        return False, 30
-
-    u["count"] += 1
-    save(data)
-    return True, u["count"]
+    return limiter.check(uid, name)
 
 def ask_gemini(prompt):
-    try:
-        model = genai.GenerativeModel(MODEL)
-        r = model.generate_content(prompt, generation_config={"max_output_tokens": 150}) # You can change this
-        return r.text.strip()
-    except Exception as e:
-        return f"🤖 Gemini error: {e}"
+    """Async iterator potongan jawaban Gemini (streaming, tidak memblokir event loop)."""
+    return gemini.stream(MODEL, [{"role": "user", "content": prompt}], max_tokens=MAX_OUTPUT_TOKENS)
 
 # --- command /start ---
 # Example Code
@@ -106,14 +70,8 @@ async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
         return
 
-    bot_username = (await context.bot.get_me()).username
+    # Mention / reply sudah dicek oleh filter addressed_to_bot
     text = update.message.text
-    mention = f"@{bot_username}" if bot_username else ""
-    is_mentioned = mention and mention in text
-    is_reply = update.message.reply_to_message and update.message.reply_to_message.from_user.id == context.bot.id
-
-    if not (is_mentioned or is_reply):
-        return
 
     user = update.effective_user
     ok, used = can_use(user.id, user.username or user.first_name)
@@ -127,16 +85,26 @@ async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id=update.effective_chat.id, action="typing"
     )
 
-    prompt = text.replace(mention, "").strip()
-    reply = ask_gemini(prompt)
-    await update.message.reply_text(reply)
+    prompt = addressed_to_bot.strip_mention(text)
+    thinking_msg = await update.message.reply_text("🤖 Thinking...")
+    try:
+        reply, coalescer = await stream_chunks_to_message(ask_gemini(prompt), thinking_msg, context.bot)
+        await coalescer.finish(reply[:4000] if reply else "🤖 Gemini returned no answer.")
+    except Exception as e:
+        await thinking_msg.edit_text(f"🤖 Gemini error: {e}")
+
+# --- startup: cache identitas bot untuk filter mention/reply ---
+async def post_init(application: Application) -> None:
+    addressed_to_bot.load_identity(application.bot)
 
 # --- main ---
 if __name__ == "__main__":
-    app = Application.builder().token(TOKEN).build()
+    app = Application.builder().token(TOKEN).concurrent_updates(True).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("premium", premium_cmd))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & addressed_to_bot, handle))
+    app.post_init = post_init
     print("Bot Gemini ready! Enjoy.")
-    app.run_polling()
\ No newline at end of file
+    limiter.start()
+    webhook.run(app)
\ No newline at end of file
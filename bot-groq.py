@@ -11,16 +11,36 @@ except ImportError:
 
 import re
 import json
+import hashlib
+import math
 import time
+import asyncio
+import functools
 import threading
+import weakref
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from duckduckgo_search import DDGS
-import openai
+from ratelimit import RateLimiter
+from bot_filters import addressed_to_bot
+from broadcast import broadcast, load_all_groups
+from formatting import strip_markdown
+from streaming import EditCoalescer, ReplayText, stream_chunks_to_message
+from singleflight import SingleFlight
+from genqueue import GenerationQueue, Overloaded, QueueFull
+import metrics
+import webhook
+from llm_providers import GeminiProvider, GroqProvider, LLMRouter, OllamaProvider, parse_routes
+import httpx
+from openai import AsyncOpenAI
 from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     filters,
+    TypeHandler,
     ContextTypes,
 )
 
@@ -31,8 +51,7 @@ if not GROQ_API_KEY:
     print("⚠️ WARNING: GROQ_API_KEY not set!")
     GROQ_API_KEY = ""
 
-openai.api_key = GROQ_API_KEY
-openai.base_url = "https://api.groq.com/openai/v1/"
+GROQ_BASE_URL = "https://api.groq.com/openai/v1/"
 
 # --- Model Groq yang tersedia ---
 # llama-3.3-70b-versatile (Tercepat & Terbaru)
@@ -51,6 +70,22 @@ DATA_FILE = "users.json"
 GROUPS_FILE = "groups.json"
 CONVERSATIONS_FILE = "conversations.json"
 
+# --- Metrics per tahap request (lihat /stats dan endpoint METRICS_PORT) ---
+UPDATES = metrics.counter("bot_updates_total", "Update Telegram yang diterima", ("type",))
+UPDATE_DELAY = metrics.histogram(
+    "bot_update_delay_seconds", "Jeda dari pesan dikirim user sampai diterima bot",
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 300)
+)
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Durasi handler end-to-end", ("handler",))
+RATELIMIT_SECONDS = metrics.histogram(
+    "bot_ratelimit_check_seconds", "Durasi cek rate limit",
+    buckets=(1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 1e-3, 1e-2)
+)
+RATELIMIT_REJECTED = metrics.counter("bot_ratelimit_rejected_total", "Request yang ditolak rate limit")
+STORAGE_SECONDS = metrics.histogram("bot_storage_seconds", "Durasi operasi storage (Supabase/JSON)", ("op",))
+SEARCH_SECONDS = metrics.histogram("bot_web_search_seconds", "Durasi web search (cache miss)")
+ERRORS = metrics.counter("bot_errors_total", "Error per tahap", ("stage",))
+
 # --- Global state untuk disabled modes ---
 disabled_modes = set()  # {'halus', 'kasar', 'informasi'}
 
@@ -71,22 +106,37 @@ except Exception as e:
     print(f"⚠️ Supabase connection failed: {e}")
 
 # --- Disabled modes functions (using Supabase) ---
-def load_disabled_modes():
-    """Load disabled modes from Supabase."""
+# Hot path hanya baca set `disabled_modes` di memori. Job periodik me-refresh
+# dari Supabase supaya /off /on di replica lain ikut kebawa dalam beberapa detik.
+SETTINGS_REFRESH_INTERVAL = int(os.getenv("SETTINGS_REFRESH_INTERVAL", "10"))
+_settings_generation = 0  # naik setiap perubahan lokal (/off, /on)
+
+def fetch_disabled_modes():
+    """Query disabled modes dari Supabase. Return None kalau gagal / tanpa Supabase."""
+    if not supabase:
+        return None
+    try:
+        result = supabase.table("bot_settings").select("value").eq("key", "disabled_modes").execute()
+        if result.data and result.data[0].get("value"):
+            return set(result.data[0]["value"])
+        return set()
+    except Exception as e:
+        print(f"⚠️ Failed to load disabled modes: {e}")
+        return None
+
+def apply_disabled_modes(modes, generation: int):
+    """Pakai hasil fetch, kecuali ada perubahan lokal sejak fetch dimulai."""
     global disabled_modes
-    if supabase:
-        try:
-            result = supabase.table("bot_settings").select("value").eq("key", "disabled_modes").execute()
-            if result.data and result.data[0].get("value"):
-                disabled_modes = set(result.data[0]["value"])
-                print(f"✅ Loaded disabled modes: {disabled_modes}")
-            else:
-                disabled_modes = set()
-        except Exception as e:
-            print(f"⚠️ Failed to load disabled modes: {e}")
-            disabled_modes = set()
+    if modes is not None and generation == _settings_generation and modes != disabled_modes:
+        disabled_modes = modes
+        print(f"✅ Loaded disabled modes: {disabled_modes}")
     return disabled_modes
 
+def load_disabled_modes():
+    """Load disabled modes from Supabase."""
+    generation = _settings_generation
+    return apply_disabled_modes(fetch_disabled_modes(), generation)
+
 def save_disabled_modes():
     """Save disabled modes to Supabase."""
     if supabase:
@@ -105,79 +155,300 @@ load_disabled_modes()
 # --- persist user data ---
 lock = threading.Lock()
 
-def load():
-    """Load user rate limit data."""
-    with lock:
-        try:
-            return json.load(open(DATA_FILE))
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-
-def save(data):
-    with lock:
-        json.dump(data, open(DATA_FILE, "w"), indent=2)
-
 def load_groups():
-    """Load groups - try Supabase first, fallback to JSON."""
-    if supabase:
-        try:
-            result = supabase.table("groups").select("*").execute()
-            return {str(row["chat_id"]): row["title"] for row in result.data}
-        except Exception as e:
-            print(f"Supabase groups error: {e}")
-    # Fallback to JSON
+    """Load semua groups - Supabase per halaman (tidak terpotong max-rows), fallback ke JSON."""
     with lock:
-        try:
-            return json.load(open(GROUPS_FILE))
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        return load_all_groups(supabase, GROUPS_FILE)
 
-def save_groups(groups):
-    """Save groups to Supabase."""
+def save_groups(groups: dict, changed: dict = None) -> bool:
+    """
+    Save groups: satu bulk upsert ke Supabase (hanya `changed` kalau diisi),
+    fallback tulis seluruh `groups` ke JSON secara atomic.
+    """
+    rows = groups if changed is None else changed
     if supabase:
         try:
-            for chat_id, title in groups.items():
-                supabase.table("groups").upsert({
-                    "chat_id": int(chat_id),
-                    "title": title
-                }).execute()
-            return
+            if rows:
+                supabase.table("groups").upsert([
+                    {"chat_id": int(chat_id), "title": title}
+                    for chat_id, title in rows.items()
+                ]).execute()
+            return True
         except Exception as e:
             print(f"Supabase save groups error: {e}")
     # Fallback
     with lock:
-        json.dump(groups, open(GROUPS_FILE, "w"), indent=2)
+        tmp = f"{GROUPS_FILE}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(groups, f, indent=2)
+            os.replace(tmp, GROUPS_FILE)
+            return True
+        except OSError as e:
+            print(f"Save groups JSON error: {e}")
+            return False
+
+
+# --- group registry (in-memory, flush batch) ---
+GROUPS_FLUSH_INTERVAL = int(os.getenv("GROUPS_FLUSH_INTERVAL", "30"))
+
+
+class GroupRegistry:
+    """
+    Daftar grup di memori. Di-load sekali saat startup; touch() hanya menandai
+    entry dirty kalau chat ID baru atau title berubah. flush() menulis semua
+    entry dirty sekaligus (dipanggil periodik dan saat shutdown).
+    """
+
+    def __init__(self):
+        self._groups = {}
+        self._dirty = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        groups = load_groups()
+        with self._lock:
+            # Entry yang sudah di-touch sebelum load tetap menang
+            groups.update(self._groups)
+            self._groups = groups
+
+    def touch(self, chat_id, title) -> bool:
+        key = str(chat_id)
+        if self._groups.get(key) == title:
+            return False
+        with self._lock:
+            self._groups[key] = title
+            self._dirty[key] = title
+        return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._groups)
+
+    def flush(self) -> int:
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+            groups = dict(self._groups)
+        if not save_groups(groups, dirty):
+            # Gagal: kembalikan ke dirty (kecuali yang sudah di-touch ulang)
+            with self._lock:
+                for key, title in dirty.items():
+                    self._dirty.setdefault(key, title)
+            return 0
+        return len(dirty)
+
+    def __len__(self):
+        return len(self._groups)
+
+
+group_registry = GroupRegistry()
+group_registry.load()
+
+# --- token counting ---
+def estimate_tokens(text: str) -> int:
+    """Estimasi jumlah token (~4 karakter per token, cukup untuk budgeting)."""
+    return len(text) // 4 + 1
+
+
+def message_tokens(msg: dict) -> int:
+    """Jumlah token satu message; disimpan di field 'tokens' supaya tidak dihitung ulang."""
+    tokens = msg.get("tokens")
+    if tokens is None:
+        tokens = msg["tokens"] = estimate_tokens(msg.get("content") or "")
+    return tokens
+
+
+# --- conversation cache (in-process, write-through) ---
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "5000"))
+# Detik idle sebelum di-evict. Mode webhook bisa jalan multi-instance: cache per proses
+# harus pendek supaya /clear atau ganti mode di instance lain cepat kelihatan (0 = off).
+CONVERSATION_CACHE_TTL = int(os.getenv("CONVERSATION_CACHE_TTL", "10" if webhook.webhook_enabled() else "1800"))
+MAX_HISTORY_MESSAGES = 30
+
+
+class ConversationCache:
+    """
+    LRU cache untuk record conversation (mode, username, messages).
+    Write-through: setiap perubahan langsung di-upsert ke Supabase,
+    jadi cache hanya menghemat read. User yang idle lebih dari TTL di-evict.
+    """
+
+    def __init__(self, max_size: int = CONVERSATION_CACHE_SIZE, ttl: int = CONVERSATION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # user_id -> (last_access, record)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, count: bool = True):
+        """`count=False` untuk cek ulang yang tidak boleh dihitung dua kali di hits/misses."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._data[user_id]
+                if count:
+                    self.misses += 1
+                return None
+            self._data[user_id] = (now, entry[1])
+            self._data.move_to_end(user_id)
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: int, record: dict):
+        now = time.time()
+        with self._lock:
+            self._data[user_id] = (now, record)
+            self._data.move_to_end(user_id)
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # Buang yang paling lama tidak diakses kalau penuh
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+        # Buang user idle dari ujung LRU
+        while self._data:
+            user_id, (last_access, _) = next(iter(self._data.items()))
+            if now - last_access <= self.ttl:
+                break
+            del self._data[user_id]
+
+    def __contains__(self, user_id):
+        return user_id in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+conversation_cache = ConversationCache()
+
+
+def _copy_record(record: dict) -> dict:
+    return {
+        "mode": record.get("mode"),
+        "messages": list(record.get("messages") or []),
+        "username": record.get("username"),
+    }
+
+
+# Schema: `conversations` = satu row per user (mode, username); history di
+# `conversation_messages` = satu row per message, index (user_id, created_at).
+# Tulis history = 1 insert, baca = N row terakhir, berapapun panjang history.
+# Pindahkan data lama (kolom JSON `messages`) dengan migrate_conversations.py.
+MESSAGES_TABLE = "conversation_messages"
+
+
+def _to_timestamptz(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _from_timestamptz(value) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _write_conversation(user_id: int, record: dict) -> bool:
+    """Upsert mode & username user (history tidak ikut ditulis)."""
+    if not supabase:
+        return True
+    try:
+        supabase.table("conversations").upsert({
+            "user_id": user_id,
+            "mode": record.get("mode"),
+            "username": record.get("username"),
+        }).execute()
+        return True
+    except Exception as e:
+        print(f"Supabase write conversation error: {e}")
+        return False
+
+
+def _insert_message(user_id: int, message: dict) -> bool:
+    """Append satu message ke history: single-row insert."""
+    if not supabase:
+        return True
+    try:
+        supabase.table(MESSAGES_TABLE).insert({
+            "user_id": user_id,
+            "role": message["role"],
+            "content": message["content"],
+            "tokens": message["tokens"],
+            "created_at": _to_timestamptz(message["timestamp"]),
+        }, returning="minimal").execute()
+        return True
+    except Exception as e:
+        print(f"Supabase insert message error: {e}")
+        return False
+
+
+def _read_recent_messages(user_id: int, limit: int = MAX_HISTORY_MESSAGES) -> list:
+    """Ambil `limit` message terakhir yang belum lewat TTL (index scan user_id, created_at)."""
+    rows = (
+        supabase.table(MESSAGES_TABLE)
+        .select("role, content, tokens, created_at")
+        .eq("user_id", user_id)
+        .gt("created_at", _to_timestamptz(time.time() - CONVERSATION_TTL))
+        .order("created_at", desc=True)
+        .limit(limit)
+        .execute()
+        .data
+    )
+    return [
+        {
+            "role": row["role"],
+            "content": row["content"],
+            "timestamp": _from_timestamptz(row.get("created_at")),
+            "tokens": row.get("tokens") or estimate_tokens(row["content"]),
+        }
+        for row in reversed(rows)
+    ]
+
 
 # --- conversation history with mode (Supabase) ---
 def get_user_data(user_id: int) -> dict:
-    """Get user conversation data including mode from Supabase."""
+    """Get user conversation data including mode (cache dulu, baru Supabase)."""
+    cached = conversation_cache.get(user_id)
+    if cached is not None:
+        return _copy_record(cached)
+    return fetch_user_data(user_id)
+
+def fetch_user_data(user_id: int) -> dict:
+    """Baca record dari Supabase lalu simpan ke cache (tanpa cek cache)."""
+    record = {"mode": None, "messages": [], "username": None}
     if supabase:
         try:
-            result = supabase.table("conversations").select("*").eq("user_id", user_id).execute()
+            result = supabase.table("conversations").select("mode, username").eq("user_id", user_id).execute()
             if result.data:
                 row = result.data[0]
-                return {
-                    "mode": row.get("mode"),
-                    "messages": row.get("messages") or [],
-                    "username": row.get("username")
-                }
+                record["mode"] = row.get("mode")
+                record["username"] = row.get("username")
         except Exception as e:
             print(f"Supabase get_user_data error: {e}")
-    return {"mode": None, "messages": [], "username": None}
-
-def set_user_mode(user_id: int, mode: str, username: str = None):
-    """Set mode untuk user di Supabase."""
-    if supabase:
+            # Jangan cache hasil error supaya request berikutnya coba lagi
+            return record
         try:
-            supabase.table("conversations").upsert({
-                "user_id": user_id,
-                "mode": mode,
-                "username": username,
-                "messages": get_user_data(user_id).get("messages", [])
-            }).execute()
-            return
+            record["messages"] = _read_recent_messages(user_id)
         except Exception as e:
-            print(f"Supabase set_user_mode error: {e}")
+            # Mode tetap dipakai (mis. tabel history belum dimigrasi); jangan di-cache
+            print(f"Supabase read history error: {e}")
+            return record
+    conversation_cache.put(user_id, record)
+    return _copy_record(record)
+
+def set_user_mode(user_id: int, mode: str, username: str = None):
+    """Set mode untuk user (write-through ke Supabase)."""
+    record = get_user_data(user_id)
+    record["mode"] = mode
+    record["username"] = username
+    if _write_conversation(user_id, record):
+        conversation_cache.put(user_id, record)
 
 def get_user_mode(user_id: int) -> str:
     """Get current mode for user."""
@@ -191,106 +462,258 @@ def get_user_history(user_id: int, max_messages: int = 15) -> list:
     return messages[-max_messages:]
 
 def add_to_history(user_id: int, role: str, content: str):
-    """Add message ke conversation history di Supabase."""
-    if supabase:
-        try:
-            data = get_user_data(user_id)
-            messages = data.get("messages", [])
-            messages.append({
-                "role": role,
-                "content": content,
-                "timestamp": time.time()
-            })
-            # Keep only last 30 messages
-            messages = messages[-30:]
-            
-            supabase.table("conversations").upsert({
-                "user_id": user_id,
-                "mode": data.get("mode"),
-                "username": data.get("username"),
-                "messages": messages
-            }).execute()
-            return
-        except Exception as e:
-            print(f"Supabase add_to_history error: {e}")
+    """Add message ke conversation history (1 insert ke Supabase, cache ikut di-update)."""
+    record = get_user_data(user_id)
+    message = {
+        "role": role,
+        "content": content,
+        "timestamp": time.time(),
+        "tokens": estimate_tokens(content)
+    }
+    if not _insert_message(user_id, message):
+        return
+    # Cache cukup simpan 30 message terakhir yang belum lewat TTL
+    record["messages"] = _fresh_messages(
+        (record["messages"] + [message])[-MAX_HISTORY_MESSAGES:], time.time() - CONVERSATION_TTL
+    )
+    conversation_cache.put(user_id, record)
 
 def clear_user_history(user_id: int) -> dict:
     """Clear conversation history dan mode untuk user."""
     old_data = get_user_data(user_id)
-    
+    record = {"mode": None, "messages": [], "username": old_data.get("username")}
     if supabase:
         try:
-            supabase.table("conversations").upsert({
-                "user_id": user_id,
-                "mode": None,
-                "username": old_data.get("username"),
-                "messages": []
-            }).execute()
+            supabase.table(MESSAGES_TABLE).delete(returning="minimal").eq("user_id", user_id).execute()
         except Exception as e:
-            print(f"Supabase clear error: {e}")
+            # History gagal dihapus: jangan reset mode juga supaya DB & cache tetap sama
+            print(f"Supabase clear history error: {e}")
+            return {"mode": old_data.get("mode"), "username": old_data.get("username"), "cleared": False}
+    cleared = _write_conversation(user_id, record)
+    if not cleared:
+        record["mode"] = old_data.get("mode")  # History sudah terhapus, mode masih yang lama
+    conversation_cache.put(user_id, record)
     
-    return {"mode": old_data.get("mode"), "username": old_data.get("username")}
+    return {"mode": old_data.get("mode"), "username": old_data.get("username"), "cleared": cleared}
 
-def cleanup_old_conversations():
-    """Auto cleanup conversations older than 24 hours."""
-    # This function is not fully adapted to Supabase in the provided diff.
-    # It still relies on a 'conversations' object that would typically come from load_conversations().
-    # For now, keeping the original logic as per the instruction's partial diff.
-    # A full Supabase implementation would query and update directly.
-    conversations = {} # Placeholder, as load_conversations is removed
-    if supabase:
-        try:
-            # Fetch all conversations from Supabase
-            result = supabase.table("conversations").select("user_id, messages").execute()
-            for row in result.data:
-                conversations[str(row["user_id"])] = row["messages"]
-        except Exception as e:
-            print(f"Supabase cleanup_old_conversations fetch error: {e}")
-            # Fallback to empty if Supabase fails
-            conversations = {}
-
-    now = time.time()
-    cutoff = now - (24 * 60 * 60)  # 24 hours
-    
-    for uid in list(conversations.keys()):
-        # Filter messages yang masih fresh
-        conversations[uid] = [
-            msg for msg in conversations[uid]
-            if msg.get("timestamp", now) > cutoff
-        ]
-        
-        # Hapus user yang tidak punya message lagi
-        if not conversations[uid]:
-            del conversations[uid]
-    
-    save_conversations(conversations)
+# --- async storage layer ---
+# Semua akses Supabase pakai client sync (.execute()), jadi dijalankan di
+# thread pool terbatas supaya event loop PTB tidak freeze saat query lambat.
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "8"))
 
-def can_use(uid, name):
-    data = load()
-    now = time.time()
 
-    if str(uid) not in data:
-        data[str(uid)] = {"count": 0, "reset": now + 1800, "premium": False}
-    u = data[str(uid)]
+def _timed_storage_call(func, *args):
+    """Dijalankan di thread storage: catat durasi per operasi."""
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    except Exception:
+        ERRORS.inc(stage="storage")
+        raise
+    finally:
+        STORAGE_SECONDS.observe(time.perf_counter() - started, op=func.__name__)
+
+
+class AsyncStorage:
+    """
+    Interface async untuk conversations, groups dan settings.
+    Handler cukup `await storage.<method>(...)`; cache hit dijawab langsung
+    di event loop, sisanya dijalankan di executor.
+    """
+
+    def __init__(self, max_workers: int = STORAGE_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self._user_locks = weakref.WeakValueDictionary()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(_timed_storage_call, func, *args))
+
+    def _lock_for(self, user_id: int) -> asyncio.Lock:
+        # Serialisasi read-modify-write per user supaya update tidak saling timpa
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[user_id] = lock
+        return lock
+
+    # --- conversations ---
+    async def get_user_data(self, user_id: int) -> dict:
+        cached = conversation_cache.get(user_id)
+        if cached is not None:
+            return _copy_record(cached)
+        # Miss: baca di bawah lock user supaya put() tidak menimpa add_to_history yang barusan jalan
+        async with self._lock_for(user_id):
+            cached = conversation_cache.get(user_id, count=False)
+            if cached is not None:
+                return _copy_record(cached)  # Sudah di-load coroutine lain selama menunggu lock
+            return await self._run(fetch_user_data, user_id)
+
+    async def get_user_mode(self, user_id: int) -> str:
+        return (await self.get_user_data(user_id)).get("mode")
+
+    async def get_user_history(self, user_id: int, max_messages: int = 15) -> list:
+        messages = (await self.get_user_data(user_id)).get("messages", [])
+        return messages[-max_messages:]
+
+    async def set_user_mode(self, user_id: int, mode: str, username: str = None):
+        async with self._lock_for(user_id):
+            await self._run(set_user_mode, user_id, mode, username)
+
+    async def add_to_history(self, user_id: int, role: str, content: str):
+        async with self._lock_for(user_id):
+            await self._run(add_to_history, user_id, role, content)
+
+    async def clear_user_history(self, user_id: int) -> dict:
+        async with self._lock_for(user_id):
+            return await self._run(clear_user_history, user_id)
+
+    # --- groups ---
+    async def flush_groups(self) -> int:
+        return await self._run(group_registry.flush)
+
+    # --- settings ---
+    async def load_disabled_modes(self) -> set:
+        # Query di thread, tapi assign ke global di event loop supaya tidak
+        # balapan dengan /off /on yang mengubah set di handler
+        generation = _settings_generation
+        modes = await self._run(fetch_disabled_modes)
+        return apply_disabled_modes(modes, generation)
+
+    async def save_disabled_modes(self):
+        global _settings_generation
+        _settings_generation += 1
+        await self._run(save_disabled_modes)
+
+    # --- maintenance ---
+    async def cleanup_old_conversations(self) -> dict:
+        return await self._run(cleanup_old_conversations)
+
+    def queue_depth(self) -> int:
+        """Jumlah operasi yang menunggu thread storage kosong."""
+        return self._executor._work_queue.qsize()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+storage = AsyncStorage()
+
+
+# --- retention: buang message lebih tua dari TTL ---
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", str(24 * 60 * 60)))  # 24 jam
+CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", "3600"))
 
-    if now > u["reset"]:
-        u["count"] = 0
-        u["reset"] = now + 1800
 
-    if name == ADMIN:
-        u["premium"] = True
+def _fresh_messages(messages: list, cutoff: float) -> list:
+    # Message tanpa timestamp dianggap masih fresh
+    return [msg for msg in messages if msg.get("timestamp", cutoff + 1) > cutoff]
 
-    if u["premium"]:
-        save(data)
-        return True, u["count"]
 
-    if u["count"] >= 30:
-        save(data)
-        return False, 30
+def cleanup_old_conversations(ttl: int = CONVERSATION_TTL) -> dict:
+    """
+    Auto cleanup conversations older than TTL: satu DELETE per run untuk
+    semua message yang lewat TTL (pakai index created_at). Cache tidak perlu
+    disentuh karena history di cache sudah dipangkas di add_to_history.
+    """
+    stats = {"deleted": 0}
+    if not supabase:
+        return stats
+
+    try:
+        result = (
+            supabase.table(MESSAGES_TABLE)
+            .delete(count="exact", returning="minimal")
+            .lt("created_at", _to_timestamptz(time.time() - ttl))
+            .execute()
+        )
+        stats["deleted"] = result.count or 0
+    except Exception as e:
+        print(f"Supabase cleanup_old_conversations error: {e}")
+    return stats
+
+# --- rate limit (in-memory token bucket, snapshot periodik ke DATA_FILE) ---
+limiter = RateLimiter(limit=30, window=1800, path=DATA_FILE, admin=ADMIN)
+
+def can_use(uid, name):
+    with RATELIMIT_SECONDS.time():
+        ok, used = limiter.check(uid, name)
+    if not ok:
+        RATELIMIT_REJECTED.inc()
+    return ok, used
+
+# --- scheduler request LLM: lane prioritas admin > premium > free ---
+# Semua generasi lewat satu antrian terbatas. User free di-shed di depan
+# (balasan "server sibuk") kalau estimasi tunggunya > SHED_WAIT_SECONDS.
+REQUEST_CONCURRENCY = int(os.getenv("REQUEST_CONCURRENCY", "24"))
+REQUEST_QUEUE_SIZE = int(os.getenv("REQUEST_QUEUE_SIZE", "200"))  # batas antrian per lane
+REQUEST_SERVICE_ESTIMATE = float(os.getenv("REQUEST_SERVICE_ESTIMATE", "8"))  # detik per request sebelum ada data
+SHED_WAIT_SECONDS = float(os.getenv("SHED_WAIT_SECONDS", "20"))
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "256"))  # update Telegram yang diproses bareng
+LANE_ADMIN, LANE_PREMIUM, LANE_FREE = 0, 1, 2
+LANE_NAMES = ("admin", "premium", "free")
+BUSY_TEXT = "🚦 Server lagi sibuk, coba lagi sebentar lagi ya."
+
+scheduler = GenerationQueue(
+    concurrency=REQUEST_CONCURRENCY,
+    max_waiting=REQUEST_QUEUE_SIZE,
+    lanes=len(LANE_NAMES),
+    shed_after={LANE_FREE: SHED_WAIT_SECONDS},
+    service_estimate=REQUEST_SERVICE_ESTIMATE,
+)
+SCHEDULER_WAIT = metrics.histogram("bot_scheduler_wait_seconds", "Waktu tunggu di antrian request", ("lane",))
+SCHEDULER_REJECTED = metrics.counter(
+    "bot_scheduler_rejected_total", "Request ditolak scheduler (full = antrian penuh, shed = estimasi lama)",
+    ("lane", "reason"),
+)
+
+def request_lane(user) -> int:
+    if user.username and f"@{user.username}" == ADMIN:
+        return LANE_ADMIN
+    if limiter.is_premium(user.id):
+        return LANE_PREMIUM
+    return LANE_FREE
+
+async def run_scheduled(user, message, bot, job, refund: bool = True, text: str = None):
+    """
+    Jalankan `job()` (coroutine factory) setelah dapat slot scheduler. Selama
+    menunggu, posisi antrian ditampilkan di `message` (thinking message, isi
+    saat ini = `text`). Return hasil job, atau None kalau ditolak (message
+    diganti BUSY_TEXT dan token rate limit dikembalikan).
+    Edit posisi lewat slot edit per chat (EditCoalescer): kalau slot chat
+    belum kosong, update posisi di-skip supaya tidak kena flood limit.
+    """
+    lane = request_lane(user)
+    original = text or message.text
+    coalescer = EditCoalescer(bot, message)
+    coalescer.last_text = original
+
+    async def show_position(pos):
+        await coalescer.update(f"⏳ Antrian ke-{pos}...\n{original}")
+
+    started = time.perf_counter()
+    try:
+        await scheduler.acquire(show_position, lane=lane)
+    except QueueFull as e:
+        reason = "shed" if isinstance(e, Overloaded) else "full"
+        SCHEDULER_REJECTED.inc(lane=LANE_NAMES[lane], reason=reason)
+        if refund:
+            limiter.refund(user.id)
+        try:
+            await coalescer.finish(BUSY_TEXT)
+        except Exception:
+            pass
+        return None
 
-    u["count"] += 1
-    save(data)
-    return True, u["count"]
+    acquired = time.perf_counter()
+    SCHEDULER_WAIT.observe(acquired - started, lane=LANE_NAMES[lane])
+    try:
+        # Kembalikan teks asli kalau sempat diganti posisi antrian (skip kalau slot chat penuh,
+        # edit berikutnya dari job akan menimpanya)
+        await coalescer.update(original)
+        return await job()
+    finally:
+        scheduler.release(time.perf_counter() - acquired)
 
 # --- helper split long message ---
 def split_message(text: str, chunk_size: int = 4000):
@@ -370,143 +793,6 @@ def convert_markdown_to_telegram(text: str) -> str:
     return text
 
 
-def sanitize_html(text: str) -> str:
-    """Sanitize HTML - escape dangerous chars but preserve valid tags."""
-    import re
-    
-    # Daftar tag HTML yang valid untuk Telegram
-    valid_tags = ['b', 'i', 'code', 'pre', 'u', 'a']
-    
-    # Pattern untuk detect valid HTML tags
-    valid_tag_pattern = '|'.join(valid_tags)
-    protected_tags = []
-    placeholder = "___VALIDTAG{}___"
-    
-    # Step 1: Extract dan protect valid tags
-    counter = 0
-    def protect_tag(match):
-        nonlocal counter
-        protected_tags.append(match.group(0))
-        result = placeholder.format(counter)
-        counter += 1
-        return result
-    
-    # Protect opening dan closing tags
-    text = re.sub(f'</?({valid_tag_pattern})(\\s[^>]*)?>',protect_tag, text)
-    
-    # Step 2: Escape semua <, >, & yang tersisa
-    text = text.replace('&', '&')  # Escape & dulu
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    
-    # Step 3: Restore protected tags
-    for i, tag in enumerate(protected_tags):
-        text = text.replace(placeholder.format(i), tag)
-    
-    return text
-
-
-def markdown_to_html(text: str) -> str:
-    """Convert markdown formatting ke HTML untuk Telegram."""
-    import re
-    
-    # Convert markdown tables ke format text yang lebih readable
-    text = convert_markdown_tables(text)
-    
-    # Convert **bold** ke <b>bold</b>
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    
-    # Convert *italic* ke <i>italic</i> (tapi jangan yang sudah ** atau di dalam tag)
-    text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', text)
-    
-    # Convert `code` ke <code>code</code>
-    text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
-    
-    # Convert __underline__ ke <u>underline</u>
-    text = re.sub(r'__(.+?)__', r'<u>\1</u>', text)
-    
-    # Sanitize HTML - escape karakter berbahaya
-    text = sanitize_html(text)
-    
-    # Clean up multiple newlines (max 2 newlines berturut-turut)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    
-    # Clean up trailing/leading whitespace per line
-    lines = [line.rstrip() for line in text.split('\n')]
-    text = '\n'.join(lines)
-    
-    return text
-
-
-def convert_markdown_tables(text: str) -> str:
-    """Convert markdown tables ke format bullet list yang mobile-friendly."""
-    import re
-    
-    # Pattern untuk detect markdown table
-    table_pattern = r'(\|.+\|[\r\n]+)(\|[\s\-:|]+\|[\r\n]+)((?:\|.+\|[\r\n]*)+)'
-    
-    def table_replacer(match):
-        header_row = match.group(1)
-        data_rows = match.group(3)
-        
-        # Parse header
-        headers = [h.strip() for h in header_row.strip().split('|') if h.strip()]
-        
-        # Parse data rows  
-        rows = []
-        for line in data_rows.strip().split('\n'):
-            if line.strip():
-                cells = [c.strip() for c in line.strip().split('|') if c.strip()]
-                if cells:
-                    rows.append(cells)
-        
-        # Format sebagai list dengan header sebagai section
-        result = ["\n"]
-        
-        for row in rows:
-            # Setiap row jadi satu entry
-            for i, (header, cell) in enumerate(zip(headers, row)):
-                if cell:  # Skip empty cells
-                    result.append(f"<b>{header}:</b> {cell}")
-            result.append("")  # Blank line between entries
-        
-        return '\n'.join(result)
-    
-    # Replace all tables
-    text = re.sub(table_pattern, table_replacer, text, flags=re.MULTILINE)
-    
-    return text
-
-
-
-def strip_markdown(text: str) -> str:
-    """Strip all markdown formatting untuk output plain text yang bersih."""
-    import re
-    
-    # Remove bold (**text** or __text__)
-    text = re.sub(r'(\*\*|__)(.*?)\1', r'\2', text)
-    
-    # Remove italic (*text* or _text_)
-    text = re.sub(r'(\*|_)(.*?)\1', r'\2', text)
-    
-    # Remove code blocks (```code```)
-    text = re.sub(r'```[\s\S]*?```', lambda m: m.group(0).replace('```', ''), text)
-    
-    # Remove inline code (`code`)
-    text = re.sub(r'`(.*?)`', r'\1', text)
-    
-    # Remove links [text](url) -> text
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
-    
-    # Remove headers (# Header)
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
-    
-    # Remove blockquotes (> quote)
-    text = re.sub(r'^>\s+', '', text, flags=re.MULTILINE)
-    
-    return text.strip()
-
-
 def format_response(reply: str) -> tuple[str, str]:
     """
     Format response - PLAIN TEXT ONLY + STRIP MARKDOWN.
@@ -523,6 +809,260 @@ def format_response(reply: str) -> tuple[str, str]:
 MODEL_HALUS = "openai/gpt-oss-120b"  # Santun, filtered
 MODEL_KASAR = "llama-3.3-70b-versatile"  # Brutal, less filtered
 MODEL_INFORMASI = "moonshotai/kimi-k2-instruct"  # RAG dengan context 256K
+LIGHT_MODEL = os.getenv("LIGHT_MODEL", "llama-3.1-8b-instant")  # Cepat & murah untuk prompt ringan
+
+# --- Async LLM client (connection pool + limit concurrency per model) ---
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Satu AsyncOpenAI dipakai bareng supaya koneksi keep-alive ke Groq di-reuse
+groq_client = AsyncOpenAI(
+    api_key=GROQ_API_KEY or "not-set",  # request akan gagal 401, bot tetap bisa start
+    base_url=GROQ_BASE_URL,
+    timeout=LLM_TIMEOUT,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=120,
+        ),
+        timeout=LLM_TIMEOUT,
+    ),
+)
+
+# Maksimal request paralel per model (atur lewat env sesuai limit akun Groq)
+MODEL_CONCURRENCY = {
+    MODEL_HALUS: int(os.getenv("LLM_CONCURRENCY_HALUS", "8")),
+    MODEL_KASAR: int(os.getenv("LLM_CONCURRENCY_KASAR", "8")),
+    MODEL_INFORMASI: int(os.getenv("LLM_CONCURRENCY_INFORMASI", "4")),
+    LIGHT_MODEL: int(os.getenv("LLM_CONCURRENCY_LIGHT", "8")),
+}
+LLM_DEFAULT_CONCURRENCY = 4
+_model_semaphores = {}
+
+
+def _model_semaphore(model: str) -> asyncio.Semaphore:
+    sem = _model_semaphores.get(model)
+    if sem is None:
+        sem = asyncio.Semaphore(MODEL_CONCURRENCY.get(model, LLM_DEFAULT_CONCURRENCY))
+        _model_semaphores[model] = sem
+    return sem
+
+
+# --- LLM routing (failover antar provider/model per mode) ---
+# Format route: "provider:model", dipisah koma, urut dari yang utama.
+# Override per mode lewat env LLM_ROUTES_HALUS / LLM_ROUTES_KASAR / LLM_ROUTES_INFORMASI.
+GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "gemini-1.5-flash")
+OLLAMA_FALLBACK_MODEL = os.getenv("OLLAMA_FALLBACK_MODEL", "llama3.1")
+
+
+def _build_llm_providers() -> dict:
+    providers = {"groq": GroqProvider(groq_client, semaphore_for=_model_semaphore)}
+    if os.getenv("GEMINI_API_KEY"):
+        try:
+            providers["gemini"] = GeminiProvider(os.getenv("GEMINI_API_KEY"))
+        except ImportError:
+            print("⚠️ GEMINI_API_KEY di-set tapi google-generativeai belum terinstall")
+    if os.getenv("OLLAMA_URL"):
+        providers["ollama"] = OllamaProvider(os.getenv("OLLAMA_URL"))
+    return providers
+
+
+def _build_llm_router(providers: dict) -> LLMRouter:
+    defaults = {
+        "halus": [f"groq:{MODEL_HALUS}", f"groq:{MODEL_KASAR}"],
+        "kasar": [f"groq:{MODEL_KASAR}", f"groq:{LIGHT_MODEL}"],
+        "informasi": [f"groq:{MODEL_INFORMASI}", f"groq:{MODEL_KASAR}"],
+    }
+    table = {}
+    for mode, routes in defaults.items():
+        if "gemini" in providers:
+            routes.append(f"gemini:{GEMINI_FALLBACK_MODEL}")
+        if "ollama" in providers:
+            routes.append(f"ollama:{OLLAMA_FALLBACK_MODEL}")
+        spec = os.getenv(f"LLM_ROUTES_{mode.upper()}") or ",".join(routes)
+        table[mode] = parse_routes(spec, providers) or parse_routes(",".join(routes), providers)
+        print(f"🔀 Route {mode}: {' -> '.join(r.key for r in table[mode])}")
+    return LLMRouter(table)
+
+
+llm_providers = _build_llm_providers()
+llm_router = _build_llm_router(llm_providers)
+
+
+# --- Adaptive routing: prompt ringan ke model kecil (ladder per mode) ---
+# Ladder = route dari model terkecil ke terbesar, override lewat env
+# LLM_LADDER_HALUS / LLM_LADDER_KASAR. Prompt diklasifikasi lokal (panjang,
+# kode, keyword): trivial -> rung pertama, normal -> rung kedua, hard -> rung
+# terakhir. Setiap rung failover ke route normal mode tersebut.
+ADAPTIVE_ROUTING = os.getenv("ADAPTIVE_ROUTING", "1") == "1"
+ROUTING_TRIVIAL_TOKENS = int(os.getenv("ROUTING_TRIVIAL_TOKENS", "16"))
+ROUTING_HARD_TOKENS = int(os.getenv("ROUTING_HARD_TOKENS", "80"))
+HARD_KEYWORDS = {
+    # Indonesia
+    "jelaskan", "jelasin", "analisis", "analisa", "bandingkan", "bedanya", "perbedaan", "kenapa",
+    "mengapa", "bagaimana", "gimana", "langkah", "hitung", "rumus", "buatkan", "bikinin", "tulis",
+    "terjemahkan", "ringkas", "rangkum", "koreksi", "perbaiki", "debug", "error", "kode", "coding",
+    "program", "algoritma", "skripsi", "essay", "esai", "makalah", "lanjut", "lanjutkan",
+    # English
+    "explain", "analyze", "compare", "why", "how", "step", "calculate", "solve", "prove", "write",
+    "translate", "summarize", "fix", "code", "implement", "algorithm", "continue",
+}
+ROUTING_TIERS = ("trivial", "normal", "hard")
+ROUTING_DECISIONS = metrics.counter(
+    "bot_llm_routing_total", "Keputusan adaptive routing per mode & tier", ("mode", "tier", "route")
+)
+
+
+def _build_model_ladders(router: LLMRouter, providers: dict) -> dict:
+    """Daftarkan tiap rung sebagai entry table router ("halus@<model>"). Return mode -> [key rung]."""
+    defaults = {
+        "halus": f"groq:{LIGHT_MODEL},groq:{MODEL_HALUS}",
+        "kasar": f"groq:{LIGHT_MODEL},groq:{MODEL_KASAR}",
+    }
+    ladders = {}
+    for mode, default in defaults.items():
+        rungs = parse_routes(os.getenv(f"LLM_LADDER_{mode.upper()}") or default, providers)
+        if len(rungs) < 2:
+            continue
+        fallback = router.routes(mode)
+        keys = []
+        for rung in rungs:
+            if rung.key == fallback[0].key:
+                keys.append(mode)  # Rung = route utama mode, pakai table yang sudah ada
+                continue
+            key = f"{mode}@{rung.model}"
+            router.table[key] = [rung] + [r for r in fallback if r.key != rung.key]
+            keys.append(key)
+        ladders[mode] = keys
+        print(f"🪜 Ladder {mode}: {' < '.join(router.primary(k).key for k in keys)}")
+    return ladders
+
+
+model_ladders = _build_model_ladders(llm_router, llm_providers) if ADAPTIVE_ROUTING else {}
+
+
+def classify_prompt(prompt: str, history: list = None) -> tuple[str, str]:
+    """
+    Klasifikasi kompleksitas prompt tanpa call LLM. Returns (tier, alasan),
+    tier salah satu ROUTING_TIERS.
+    """
+    if "```" in prompt or is_pure_code(prompt):
+        return "hard", f"kode {detect_language(prompt)}"
+    tokens = estimate_tokens(prompt)
+    if tokens >= ROUTING_HARD_TOKENS:
+        return "hard", f"{tokens} token"
+    keywords = HARD_KEYWORDS.intersection(_tokenize(prompt))
+    if keywords:
+        return "hard", f"keyword {', '.join(sorted(keywords)[:3])}"
+    if history and "```" in history[-1].get("content", ""):
+        return "normal", "lanjutan jawaban berisi kode"
+    if tokens <= ROUTING_TRIVIAL_TOKENS:
+        return "trivial", f"{tokens} token"
+    return "normal", f"{tokens} token"
+
+
+def route_mode(mode: str, prompt: str, history: list = None) -> str:
+    """Pilih entry table router untuk prompt ini (mode asli kalau tidak ada ladder)."""
+    ladder = model_ladders.get(mode)
+    if not ladder:
+        return mode
+    tier, reason = classify_prompt(prompt, history)
+    index = {"trivial": 0, "normal": min(1, len(ladder) - 1), "hard": len(ladder) - 1}[tier]
+    key = ladder[index]
+    route = llm_router.primary(key).key
+    ROUTING_DECISIONS.inc(mode=mode, tier=tier, route=route)
+    print(f"🧭 Routing {mode}: {tier} ({reason}) -> {route}")
+    return key
+
+
+# --- Single-flight: prompt stateless yang identik & bersamaan cukup satu call LLM ---
+# Hanya untuk request tanpa history (jawaban tidak bergantung user); history
+# tetap ditulis per user oleh masing-masing handler. Opt-in: prompt yang
+# di-share dikirim tanpa baris "@username (ID)" di system prompt.
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "0") == "1"
+llm_flight = SingleFlight("llm")
+
+
+def request_digest(messages: list, kwargs: dict) -> str:
+    """Hash dari semua yang dikirim ke LLM (messages persis + parameter)."""
+    return hashlib.sha1(json.dumps(
+        [[(m["role"], m["content"]) for m in messages], sorted(kwargs.items())],
+        ensure_ascii=False,
+    ).encode()).hexdigest()
+
+
+def llm_stream(mode: str, messages: list, shared: bool = False, route_key: str = None, **kwargs):
+    """
+    Async iterator jawaban LLM. Urutan: cache jawaban (RESPONSE_CACHE) ->
+    single-flight (shared=True, key = request persis) -> router LLM.
+    `route_key` = hasil route_mode() (default: mode itu sendiri).
+    """
+    route_key = route_key or mode
+    cache_key = response_cache_key(mode, messages, kwargs, route_key)
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return ReplayText(cached)
+
+    def upstream():
+        chunks = llm_router.stream(route_key, messages, **kwargs)
+        return _store_response(cache_key, chunks) if cache_key is not None else chunks
+
+    if not shared or not SINGLE_FLIGHT:
+        return upstream()
+    return llm_flight.stream((route_key, request_digest(messages, kwargs)), upstream)
+
+
+async def stream_to_message(mode: str, messages: list, message, bot, shared: bool = False, route_key: str = None,
+                            **kwargs) -> tuple[str, EditCoalescer]:
+    """
+    Stream jawaban LLM (route sesuai mode, dengan failover) ke pesan 'sedang berpikir...'.
+    Returns: (full_reply mentah, coalescer) - panggil coalescer.finish() untuk edit final.
+    """
+    return await stream_chunks_to_message(llm_stream(mode, messages, shared, route_key, **kwargs), message, bot)
+
+
+# --- Context assembly (token budget per model) ---
+# Total token per request (prompt + max_tokens). Sisakan ruang untuk system
+# prompt dan jawaban; sisanya diisi history dari yang paling baru.
+MODEL_TOKEN_BUDGET = {
+    MODEL_HALUS: int(os.getenv("TOKEN_BUDGET_HALUS", "6000")),
+    MODEL_KASAR: int(os.getenv("TOKEN_BUDGET_KASAR", "6000")),
+    MODEL_INFORMASI: int(os.getenv("TOKEN_BUDGET_INFORMASI", "8000")),
+}
+DEFAULT_TOKEN_BUDGET = 6000
+MESSAGE_OVERHEAD_TOKENS = 4  # role + separator per message
+
+
+def build_messages(system_prompt: str, history: list, prompt: str, model: str, max_tokens: int) -> list:
+    """
+    Susun messages untuk chat completion: system + history (newest -> oldest
+    sampai budget habis) + prompt user. Ukuran prompt jadi stabil berapapun
+    panjang jawaban sebelumnya.
+    """
+    budget = (
+        MODEL_TOKEN_BUDGET.get(model, DEFAULT_TOKEN_BUDGET)
+        - max_tokens
+        - estimate_tokens(system_prompt)
+        - estimate_tokens(prompt)
+        - 2 * MESSAGE_OVERHEAD_TOKENS
+    )
+    selected = []
+    for msg in reversed(history):
+        cost = message_tokens(msg) + MESSAGE_OVERHEAD_TOKENS
+        if cost > budget:
+            break  # History harus tetap berurutan, jadi stop di sini
+        budget -= cost
+        selected.append({"role": msg["role"], "content": msg["content"]})
+    selected.reverse()
+
+    return (
+        [{"role": "system", "content": system_prompt}]
+        + selected
+        + [{"role": "user", "content": prompt}]
+    )
+
 
 # --- System prompts ---
 PROMPT_HALUS = (
@@ -575,13 +1115,101 @@ PROMPT_INFORMASI = (
     "7. Jika ditanya tentang tanggal/waktu, sebutkan bahwa informasi dari web terkini."
 )
 
+# --- Search context builder (ranking + dedup + token budget) ---
+SEARCH_CONTEXT_TOKENS = int(os.getenv("SEARCH_CONTEXT_TOKENS", "3000"))
+NEAR_DUPLICATE_THRESHOLD = 0.6  # Jaccard shingle; >= ini dianggap berita yang sama
+_WORD_RE = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> list:
+    return _WORD_RE.findall(text.lower())
+
+
+def _shingles(words: list, size: int = 3) -> set:
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def bm25_scores(query: str, docs: list, k1: float = 1.5, b: float = 0.75) -> list:
+    """Skor BM25 query terhadap setiap dokumen (list of token list)."""
+    terms = set(_tokenize(query))
+    n = len(docs)
+    if not terms or not n:
+        return [0.0] * n
+    avgdl = sum(len(d) for d in docs) / n or 1.0
+    df = {t: 0 for t in terms}
+    tfs = []
+    for d in docs:
+        tf = {}
+        for w in d:
+            if w in terms:
+                tf[w] = tf.get(w, 0) + 1
+        for t in tf:
+            df[t] += 1
+        tfs.append(tf)
+    idf = {t: math.log((n - df[t] + 0.5) / (df[t] + 0.5) + 1) for t in terms}
+    scores = []
+    for d, tf in zip(docs, tfs):
+        norm = k1 * (1 - b + b * len(d) / avgdl)
+        scores.append(sum(idf[t] * f * (k1 + 1) / (f + norm) for t, f in tf.items()))
+    return scores
+
+
+def build_search_context(query: str, results: list, max_results: int = 20,
+                         token_budget: int = SEARCH_CONTEXT_TOKENS) -> str:
+    """
+    Urutkan snippet berdasarkan relevansi (BM25 title + body), buang berita
+    sindikasi yang hampir sama (shingle Jaccard), lalu isi sampai token_budget.
+    """
+    docs = [_tokenize(f"{r.get('title', '')} {r.get('body', '')}") for r in results]
+    scores = bm25_scores(query, docs)
+    # Sort stabil: skor sama tetap urutan asli (berita dulu)
+    order = sorted(range(len(results)), key=lambda i: -scores[i])
+
+    kept_shingles = []
+    context_parts = []
+    used_tokens = 0
+    for i in order:
+        if len(context_parts) >= max_results:
+            break
+        if not docs[i]:
+            continue  # Snippet kosong
+        sh = _shingles(docs[i])
+        if any(len(sh & k) / len(sh | k) >= NEAR_DUPLICATE_THRESHOLD for k in kept_shingles):
+            continue
+
+        r = results[i]
+        title = r.get('title', 'No Title')
+        body = r.get('body', 'No description')
+        href = r.get('href', 'Unknown')
+        date = r.get('date', '')
+        source_type = "[BERITA]" if r.get('source') == 'news' else "[WEB]"
+        date_info = f" ({date})" if date else ""
+        part = (
+            f"{source_type} [{len(context_parts) + 1}] {title}{date_info}\n"
+            f"    {body}\n"
+            f"    Sumber: {href}"
+        )
+        cost = estimate_tokens(part)
+        if used_tokens + cost > token_budget:
+            continue  # Snippet lain yang lebih pendek mungkin masih muat
+        used_tokens += cost
+        kept_shingles.append(sh)
+        context_parts.append(part)
+
+    return "\n\n".join(context_parts)
+
+
 # --- Web Search Function ---
-def web_search(query: str, max_results: int = 20) -> str:
+def _web_search(query: str, max_results: int = 20) -> tuple[str, bool]:
     """
     Search web menggunakan DuckDuckGo dengan kombinasi news + text search.
     Prioritaskan berita terbaru untuk hasil yang lebih fresh.
+    Returns: (context_string, ok) - ok False kalau kosong/error (jangan di-cache).
     """
     all_results = []
+    seen_hrefs = set()
     
     try:
         with DDGS(timeout=30) as ddgs:
@@ -589,10 +1217,12 @@ def web_search(query: str, max_results: int = 20) -> str:
             try:
                 news_results = list(ddgs.news(query, max_results=10, region='id-id', timelimit='m'))
                 for r in news_results:
+                    href = r.get('url', r.get('href', ''))
+                    seen_hrefs.add(href)
                     all_results.append({
                         'title': r.get('title', ''),
                         'body': r.get('body', ''),
-                        'href': r.get('url', r.get('href', '')),
+                        'href': href,
                         'date': r.get('date', ''),
                         'source': 'news'
                     })
@@ -605,7 +1235,8 @@ def web_search(query: str, max_results: int = 20) -> str:
                 for r in text_results:
                     # Skip duplikat berdasarkan URL
                     href = r.get('href', '')
-                    if not any(x.get('href') == href for x in all_results):
+                    if href not in seen_hrefs:
+                        seen_hrefs.add(href)
                         all_results.append({
                             'title': r.get('title', ''),
                             'body': r.get('body', ''),
@@ -617,34 +1248,138 @@ def web_search(query: str, max_results: int = 20) -> str:
                 pass
         
         if not all_results:
-            return "Tidak ditemukan hasil pencarian untuk query ini. Coba dengan kata kunci yang berbeda."
-        
-        # Format results sebagai context yang informatif
-        context_parts = []
-        for i, r in enumerate(all_results[:max_results], 1):
-            title = r.get('title', 'No Title')
-            body = r.get('body', 'No description')
-            href = r.get('href', 'Unknown')
-            date = r.get('date', '')
-            source_type = "[BERITA]" if r.get('source') == 'news' else "[WEB]"
-            
-            date_info = f" ({date})" if date else ""
-            context_parts.append(
-                f"{source_type} [{i}] {title}{date_info}\n"
-                f"    {body}\n"
-                f"    Sumber: {href}"
-            )
+            return "Tidak ditemukan hasil pencarian untuk query ini. Coba dengan kata kunci yang berbeda.", False
         
-        return "\n\n".join(context_parts)
+        # Ranking + dedup + token budget sebelum masuk prompt
+        return build_search_context(query, all_results, max_results), True
     
     except Exception as e:
-        return f"Error saat mencari: {str(e)}. Silakan coba lagi."
+        return f"Error saat mencari: {str(e)}. Silakan coba lagi.", False
+
+
+# --- Cache hasil web search (TTL + LRU) ---
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))  # 15 menit
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "500"))
+_QUERY_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    'Berita  Teknologi hari ini?' -> 'berita teknologi hari ini?'
+    Cuma huruf besar/kecil & spasi; simbol (+ # . -) tetap, 'C++' beda dengan 'C#'.
+    """
+    return _QUERY_SPACES.sub(" ", query.casefold()).strip()
+
+
+class TTLCache:
+    """Cache string (context search / jawaban LLM). Entry expire setelah TTL, LRU kalau penuh."""
+
+    def __init__(self, max_size: int = SEARCH_CACHE_SIZE, ttl: int = SEARCH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, context)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, context: str):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, context)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+search_cache = TTLCache()
+search_flight = SingleFlight("search")  # query identik yang sedang dicari tidak dicari ulang
+
+
+# --- Cache jawaban LLM (opt-in, exact match) ---
+# Key: mode + model utama + hash dari semua yang ikut dikirim (system prompt,
+# history, prompt persis, parameter). Jadi cache hanya kena kalau prompt dan
+# history persis sama; jawaban personal tidak bocor ke user lain.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_MODES = set(os.getenv("RESPONSE_CACHE_MODES", "halus,kasar").split(","))
+response_cache = TTLCache(max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+
+def response_cache_key(mode: str, messages: list, kwargs: dict, route_key: str = None):
+    """None kalau mode ini tidak di-cache. `route_key` = entry table router (rung ladder) yang dipakai."""
+    if not RESPONSE_CACHE or mode not in RESPONSE_CACHE_MODES:
+        return None
+    return (mode, llm_router.primary(route_key or mode).key, request_digest(messages, kwargs))
+
+
+async def _store_response(key, chunks):
+    """Teruskan chunk apa adanya; simpan ke cache hanya kalau stream selesai tanpa error."""
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    reply = "".join(parts).strip()
+    if reply:
+        response_cache.put(key, reply)
+
+
+def is_shareable(mode: str, history: list) -> bool:
+    """
+    True kalau jawaban prompt ini boleh sama untuk semua user (tanpa history,
+    dan single-flight atau response cache aktif). False = jawaban personal,
+    baris user context tetap dipasang.
+    """
+    if history:
+        return False
+    return SINGLE_FLIGHT or (RESPONSE_CACHE and mode in RESPONSE_CACHE_MODES)
+
+
+def _search_and_cache(key, query: str, max_results: int) -> str:
+    with SEARCH_SECONDS.time():
+        context, ok = _web_search(query, max_results)
+    if ok:
+        search_cache.put(key, context)
+    else:
+        ERRORS.inc(stage="search")
+    return context
 
 
-async def ask_groq_with_rag(query: str, user_id: int, username: str, message, bot) -> str:
+async def web_search_async(query: str, max_results: int = 20) -> str:
+    """
+    Web search dengan cache; query yang sama (setelah normalisasi) tidak search ulang.
+    Cache hit langsung, miss dijalankan di thread supaya event loop bebas.
+    """
+    key = (normalize_query(query), max_results)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+    return await search_flight.do(key, lambda: asyncio.to_thread(_search_and_cache, key, query, max_results))
+
+
+async def ask_groq_with_rag(query: str, user_id: int, username: str, message, bot, user=None) -> str:
     """
     RAG: Search web dulu, lalu kirim ke LLM dengan context.
-    Non-streaming untuk response yang lebih cepat.
+    Jawaban di-stream ke pesan supaya token pertama cepat kelihatan.
+    Kalau `user` diisi, slot scheduler baru diambil setelah search selesai.
     """
     try:
         # Step 1: Update message - searching
@@ -655,7 +1390,7 @@ async def ask_groq_with_rag(query: str, user_id: int, username: str, message, bo
         )
         
         # Step 2: Web search
-        search_results = web_search(query, max_results=20)
+        search_results = await web_search_async(query, max_results=20)
         
         # Step 3: Update message - processing
         await bot.edit_message_text(
@@ -666,48 +1401,49 @@ async def ask_groq_with_rag(query: str, user_id: int, username: str, message, bo
         
         # Step 4: Build prompt dengan search context
         system_prompt = PROMPT_INFORMASI.format(search_results=search_results)
-        user_context = f"\n\nKamu sedang membantu @{username} (ID: {user_id})."
-        full_system = system_prompt + user_context
-        
-        messages = [{"role": "system", "content": full_system}]
-        
-        # Add conversation history
-        history = get_user_history(user_id, max_messages=5)
-        for msg in history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
         
-        messages.append({"role": "user", "content": f"Pertanyaan: {query}"})
-        
-        # Step 5: Non-streaming response - Pakai Kimi K2 (context 256K untuk RAG)
-        response = openai.chat.completions.create(
-            model=MODEL_INFORMASI,  # Kimi K2 dengan context window 256K
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.5,  # Lebih rendah untuk akurasi
-            top_p=0.9
-        )
-        
-        full_reply = response.choices[0].message.content.strip()
-        final_text = strip_markdown(full_reply)
+        # Add conversation history (sebanyak yang muat di token budget)
+        history = await storage.get_user_history(user_id, max_messages=MAX_HISTORY_MESSAGES)
+        shared = is_shareable("informasi", history)
+        if not shared:
+            full_system = system_prompt + f"\n\nKamu sedang membantu @{username} (ID: {user_id})."
+        else:
+            # Jawaban sama untuk semua user -> boleh single-flight/cache
+            full_system = system_prompt
+        messages = build_messages(full_system, history, f"Pertanyaan: {query}", MODEL_INFORMASI, max_tokens=2000)
         
-        # Update with final response
-        try:
-            await bot.edit_message_text(
-                chat_id=message.chat.id,
-                message_id=message.message_id,
-                text=final_text[:4000] if final_text else "🤖 Tidak ada hasil"
+        # Step 5: Streaming response - Pakai Kimi K2 (context 256K untuk RAG)
+        async def generate():
+            full_reply, coalescer = await stream_to_message(
+                "informasi",  # Kimi K2 (context 256K), fallback sesuai LLM_ROUTES_INFORMASI
+                messages,
+                message,
+                bot,
+                shared=shared,
+                max_tokens=2000,
+                temperature=0.5,  # Lebih rendah untuk akurasi
+                top_p=0.9
             )
-        except Exception:
-            pass
-        
-        # Save to history
-        if user_id:
-            add_to_history(user_id, "user", query)
-            add_to_history(user_id, "assistant", full_reply)
+            final_text = strip_markdown(full_reply)
+            
+            # Update with final response
+            await coalescer.finish(final_text[:4000] if final_text else "🤖 Tidak ada hasil")
+            
+            # Save to history
+            if user_id:
+                await storage.add_to_history(user_id, "user", query)
+                await storage.add_to_history(user_id, "assistant", full_reply)
+            
+            return final_text
         
-        return final_text
+        if user is None:
+            return await generate()
+        # Slot LLM hanya dipegang selama generasi, bukan selama web search
+        final_text = await run_scheduled(user, message, bot, generate, text="🧠 Menganalisis hasil pencarian...")
+        return BUSY_TEXT if final_text is None else final_text
     
     except Exception as e:
+        ERRORS.inc(stage="llm")
         error_msg = f"🤖 Error: {str(e)}"
         try:
             await bot.edit_message_text(
@@ -720,7 +1456,7 @@ async def ask_groq_with_rag(query: str, user_id: int, username: str, message, bo
         return error_msg
 
 
-def ask_groq(prompt: str, user_id: int = None, mode: str = "halus", username: str = None) -> tuple[str, str]:
+async def ask_groq(prompt: str, user_id: int = None, mode: str = "halus", username: str = None) -> tuple[str, str]:
     """
     Query Groq API dengan dual mode support.
     mode: 'halus' (GPT OSS, sopan) atau 'kasar' (Llama, brutal)
@@ -735,41 +1471,30 @@ def ask_groq(prompt: str, user_id: int = None, mode: str = "halus", username: st
             model = MODEL_HALUS
             base_prompt = PROMPT_HALUS
         
-        # Add user context ke system prompt
+        # Build messages dengan conversation history kalau ada user_id
+        history = []
+        if user_id:
+            history = await storage.get_user_history(user_id, max_messages=MAX_HISTORY_MESSAGES)
+        
+        # Add user context ke system prompt (kecuali prompt stateless yang bisa di-share)
+        shared = is_shareable(mode, history)
         user_context = ""
-        if username:
+        if username and not shared:
             user_context = f"\n\nKamu sedang berbicara dengan @{username} (ID: {user_id})."
         
         system_prompt = base_prompt + user_context
+        messages = build_messages(system_prompt, history, prompt, model, max_tokens=1500)
         
-        # Build messages dengan conversation history
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history kalau ada user_id
-        if user_id:
-            history = get_user_history(user_id, max_messages=10)
-            for msg in history:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        # Add current prompt
-        messages.append({"role": "user", "content": prompt})
-        
-        r = openai.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=1500,
-            temperature=0.7,
-            top_p=0.9
+        chunks = llm_stream(
+            mode, messages, shared, route_mode(mode, prompt, history),
+            max_tokens=1500, temperature=0.7, top_p=0.9,
         )
-        reply = r.choices[0].message.content.strip()
+        reply = "".join([chunk async for chunk in chunks]).strip()
         
         # Save conversation history kalau ada user_id
         if user_id:
-            add_to_history(user_id, "user", prompt)
-            add_to_history(user_id, "assistant", reply)
+            await storage.add_to_history(user_id, "user", prompt)
+            await storage.add_to_history(user_id, "assistant", reply)
         
         # Format response
         formatted_reply, parse_mode = format_response(reply)
@@ -777,13 +1502,15 @@ def ask_groq(prompt: str, user_id: int = None, mode: str = "halus", username: st
         return formatted_reply, parse_mode
 
     except Exception as e:
+        ERRORS.inc(stage="llm")
         error_msg = f"🤖 Maaf, terjadi error: {str(e)}"
         return error_msg, None
 
 
 async def ask_groq_streaming(prompt: str, user_id: int, mode: str, username: str, message, bot) -> str:
     """
-    Query Groq API - Non-streaming untuk response lebih cepat.
+    Query Groq API dengan streaming: teks parsial langsung di-edit ke pesan
+    'sedang berpikir...' (dibatasi EditCoalescer supaya aman dari flood limit).
     """
     try:
         # Pilih model dan prompt berdasarkan mode
@@ -794,50 +1521,45 @@ async def ask_groq_streaming(prompt: str, user_id: int, mode: str, username: str
             model = MODEL_HALUS
             base_prompt = PROMPT_HALUS
         
-        # Add user context
-        user_context = f"\n\nKamu sedang berbicara dengan @{username} (ID: {user_id})."
-        system_prompt = base_prompt + user_context
-        
-        # Build messages
-        messages = [{"role": "system", "content": system_prompt}]
-        
+        # Build messages (history diisi sesuai token budget model)
+        history = []
         if user_id:
-            history = get_user_history(user_id, max_messages=10)
-            for msg in history:
-                messages.append({"role": msg["role"], "content": msg["content"]})
+            history = await storage.get_user_history(user_id, max_messages=MAX_HISTORY_MESSAGES)
         
-        messages.append({"role": "user", "content": prompt})
+        # Add user context (kecuali prompt stateless yang di-share/cache)
+        shared = is_shareable(mode, history)
+        if not shared:
+            system_prompt = base_prompt + f"\n\nKamu sedang berbicara dengan @{username} (ID: {user_id})."
+        else:
+            system_prompt = base_prompt
+        messages = build_messages(system_prompt, history, prompt, model, max_tokens=1500)
         
-        # Non-streaming request
-        response = openai.chat.completions.create(
-            model=model,
-            messages=messages,
+        # Streaming request
+        full_reply, coalescer = await stream_to_message(
+            mode,
+            messages,
+            message,
+            bot,
+            shared=shared,
+            route_key=route_mode(mode, prompt, history),
             max_tokens=1500,
             temperature=0.7,
             top_p=0.9
         )
-        
-        full_reply = response.choices[0].message.content.strip()
         final_text = strip_markdown(full_reply)
         
-        # Update message dengan hasil
-        try:
-            await bot.edit_message_text(
-                chat_id=message.chat.id,
-                message_id=message.message_id,
-                text=final_text[:4000] if final_text else "🤖 Respons kosong"
-            )
-        except Exception:
-            pass
+        # Update message dengan hasil akhir (tanpa cursor)
+        await coalescer.finish(final_text[:4000] if final_text else "🤖 Respons kosong")
         
         # Save to history
         if user_id:
-            add_to_history(user_id, "user", prompt)
-            add_to_history(user_id, "assistant", full_reply)
+            await storage.add_to_history(user_id, "user", prompt)
+            await storage.add_to_history(user_id, "assistant", full_reply)
         
         return final_text
 
     except Exception as e:
+        ERRORS.inc(stage="llm")
         error_msg = f"🤖 Error: {str(e)}"
         try:
             await bot.edit_message_text(
@@ -854,7 +1576,7 @@ async def ask_groq_streaming(prompt: str, user_id: int, mode: str, username: str
 # --- command /start ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    current_mode = get_user_mode(user.id) or "belum dipilih"
+    current_mode = await storage.get_user_mode(user.id) or "belum dipilih"
     await update.message.reply_text(
         f"👋 Hai @{user.username or user.first_name}!\n\n"
         f"🤖 Aku bot XMS AI dengan 3 MODE:\n"
@@ -892,6 +1614,34 @@ async def premium_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "💰 Kirim Rp 15.000 ke DM @GustyxPower dengan bukti."
     )
 
+# --- command /setpremium (admin) ---
+async def setpremium_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin only: Beri/cabut premium. Usage: /setpremium <user_id> [off]"""
+    user = update.effective_user
+    username = f"@{user.username}" if user.username else user.first_name
+    
+    # Check admin
+    if username != ADMIN:
+        await update.message.reply_text("❌ Hanya admin yang bisa menggunakan command ini.")
+        return
+    
+    if not context.args or not context.args[0].lstrip("-").isdigit():
+        await update.message.reply_text(
+            "💎 Cara pakai /setpremium:\n\n"
+            "/setpremium <user_id> - Jadikan premium\n"
+            "/setpremium <user_id> off - Cabut premium"
+        )
+        return
+    
+    target = int(context.args[0])
+    premium = not (len(context.args) > 1 and context.args[1].lower() == "off")
+    limiter.set_premium(target, premium)
+    # Langsung tulis ke users.json supaya tidak hilang kalau bot restart
+    await asyncio.to_thread(limiter.snapshot)
+    await update.message.reply_text(
+        f"💎 User {target} sekarang {'PREMIUM' if premium else 'bukan premium'}."
+    )
+
 # --- command /ping ---
 async def ping_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check bot latency and server info."""
@@ -933,6 +1683,7 @@ async def ping_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # --- command /anu ---
+@HANDLER_SECONDS.timed(handler="anu")
 async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Command /anu dengan triple mode:
@@ -951,7 +1702,7 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Cek apakah ada argumen
     if len(parts) < 2:
-        current_mode = get_user_mode(user.id) or "belum diset"
+        current_mode = await storage.get_user_mode(user.id) or "belum diset"
         await update.message.reply_text(
             f"💬 Cara pakai /anu:\n\n"
             f"/anu halus <prompt> - Mode sopan (GPT OSS)\n"
@@ -974,12 +1725,7 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Save grup info jika di grup
     chat = update.effective_chat
     if chat.type in (chat.GROUP, chat.SUPERGROUP):
-        groups = load_groups()
-        groups[str(chat.id)] = chat.title
-        save_groups(groups)
-    
-    # Reload disabled modes untuk pastikan data terbaru
-    load_disabled_modes()
+        group_registry.touch(chat.id, chat.title)
     
     # ======================
     # MODE INFORMASI (RAG) - Special handling
@@ -1022,7 +1768,8 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_id=user.id,
             username=username,
             message=thinking_msg,
-            bot=context.bot
+            bot=context.bot,
+            user=user
         )
         
 
@@ -1031,7 +1778,7 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # ======================
     # MODE HALUS / KASAR / INFORMASI
     # ======================
-    current_mode = get_user_mode(user.id)
+    current_mode = await storage.get_user_mode(user.id)
     
     if parts[1].lower() in ["halus", "kasar", "informasi"]:
         # Mode disebut secara eksplisit
@@ -1055,7 +1802,7 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Set mode baru
         if not current_mode:
-            set_user_mode(user.id, new_mode, username)
+            await storage.set_user_mode(user.id, new_mode, username)
             current_mode = new_mode
         
         # Ambil prompt (setelah mode)
@@ -1100,7 +1847,8 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_id=user.id,
             username=username,
             message=thinking_msg,
-            bot=context.bot
+            bot=context.bot,
+            user=user
         )
         
 
@@ -1110,20 +1858,20 @@ async def anu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # HANDLE MODE HALUS / KASAR
     # ======================
     mode_emoji = "😇" if current_mode == "halus" else "😈"
-    # Kirim message awal yang akan di-edit untuk typewriter effect
+    # Kirim message awal yang akan di-edit selama streaming
     thinking_msg = await update.message.reply_text(f"🤖 Mode {current_mode} {mode_emoji} sedang berpikir...")
     
     context.user_data["last_prompt"] = prompt
     
     # Gunakan streaming untuk typewriter effect
-    reply = await ask_groq_streaming(
+    reply = await run_scheduled(user, thinking_msg, context.bot, lambda: ask_groq_streaming(
         prompt=prompt,
         user_id=user.id,
         mode=current_mode,
         username=username,
         message=thinking_msg,
         bot=context.bot
-    )
+    ))
     
 
 
@@ -1134,10 +1882,16 @@ async def reload_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     user = update.effective_user
     username = user.username or user.first_name
-    current_mode = get_user_mode(user.id) or "halus"
+    current_mode = await storage.get_user_mode(user.id) or "halus"
     prompt = context.user_data["last_prompt"]
-    await update.message.reply_text("🔄 Mengulang prompt...")
-    reply, parse_mode = ask_groq(prompt, user_id=user.id, mode=current_mode, username=username)
+    notice = await update.message.reply_text("🔄 Mengulang prompt...")
+    result = await run_scheduled(
+        user, notice, context.bot, lambda: ask_groq(prompt, user_id=user.id, mode=current_mode, username=username),
+        refund=False,
+    )
+    if result is None:
+        return
+    reply, parse_mode = result
     await update.message.reply_text(reply, parse_mode=parse_mode)
 
 # --- command /clear ---
@@ -1146,8 +1900,11 @@ async def clear_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     username = user.username or user.first_name
     
-    old_data = clear_user_history(user.id)
+    old_data = await storage.clear_user_history(user.id)
     old_mode = old_data.get("mode") or "tidak ada"
+    if not old_data.get("cleared", True):
+        await update.message.reply_text("⚠️ Gagal menghapus conversation, coba lagi sebentar lagi.")
+        return
     
     await update.message.reply_text(
         f"🗑️ Conversation cleared!\n\n"
@@ -1158,18 +1915,13 @@ async def clear_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # --- handler pesan (mention / reply only) ---
+@HANDLER_SECONDS.timed(handler="mention")
 async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
         return
 
-    bot_username = (await context.bot.get_me()).username
+    # Mention / reply sudah dicek oleh filter addressed_to_bot
     text = update.message.text
-    mention = f"@{bot_username}" if bot_username else ""
-    is_mentioned = mention and mention in text
-    is_reply = update.message.reply_to_message and update.message.reply_to_message.from_user.id == context.bot.id
-
-    if not (is_mentioned or is_reply):
-        return
 
     user = update.effective_user
     ok, used = can_use(user.id, user.username or user.first_name)
@@ -1181,16 +1933,14 @@ async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     chat = update.effective_chat
     if chat.type in (chat.GROUP, chat.SUPERGROUP):
-        groups = load_groups()
-        groups[str(chat.id)] = chat.title
-        save_groups(groups)
+        group_registry.touch(chat.id, chat.title)
 
     await context.bot.send_chat_action(
         chat_id=update.effective_chat.id, action="typing"
     )
     
     username = user.username or user.first_name
-    current_mode = get_user_mode(user.id)
+    current_mode = await storage.get_user_mode(user.id)
     
     # Jika belum ada mode, minta pilih dulu
     if not current_mode:
@@ -1205,18 +1955,18 @@ async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mode_emoji = "😇" if current_mode == "halus" else "😈"
     thinking_msg = await update.message.reply_text(f"🤖 Mode {current_mode} {mode_emoji} sedang berpikir...")
 
-    prompt = text.replace(mention, "").strip()
+    prompt = addressed_to_bot.strip_mention(text)
     context.user_data["last_prompt"] = prompt
     
     # Gunakan streaming untuk typewriter effect
-    reply = await ask_groq_streaming(
+    reply = await run_scheduled(user, thinking_msg, context.bot, lambda: ask_groq_streaming(
         prompt=prompt,
         user_id=user.id,
         mode=current_mode,
         username=username,
         message=thinking_msg,
         bot=context.bot
-    )
+    ))
 
 
 
@@ -1253,7 +2003,7 @@ async def off_mode_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     disabled_modes.add(mode)
-    save_disabled_modes()
+    await storage.save_disabled_modes()
     
     await update.message.reply_text(
         f"🔒 Mode '{mode}' berhasil DIMATIKAN!\n\n"
@@ -1293,7 +2043,7 @@ async def on_mode_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     disabled_modes.discard(mode)
-    save_disabled_modes()
+    await storage.save_disabled_modes()
     
     await update.message.reply_text(
         f"🔓 Mode '{mode}' berhasil DIAKTIFKAN!\n\n"
@@ -1324,26 +2074,153 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"{model_info}"
     )
 
+def _hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits / total * 100:.1f}%" if total else "-"
+
+async def cache_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin only: Lihat statistik cache. Usage: /cache atau /cache clear [search|respon]"""
+    user = update.effective_user
+    username = f"@{user.username}" if user.username else user.first_name
+    
+    # Check admin
+    if username != ADMIN:
+        await update.message.reply_text("❌ Hanya admin yang bisa menggunakan command ini.")
+        return
+    
+    if context.args and context.args[0].lower() == "clear":
+        target = context.args[1].lower() if len(context.args) > 1 else "semua"
+        labels = {"search": "web search", "respon": "jawaban", "semua": "web search & jawaban"}
+        if target not in labels:
+            await update.message.reply_text("❓ Usage: /cache clear [search|respon]")
+            return
+        if target in ("search", "semua"):
+            search_cache.clear()
+        if target in ("respon", "semua"):
+            response_cache.clear()
+        await update.message.reply_text(f"🗑️ Cache {labels[target]} dikosongkan.")
+        return
+    
+    await update.message.reply_text(
+        "🗄️ Statistik Cache:\n\n"
+        f"🔍 Web search ({len(search_cache)}/{search_cache.max_size}, TTL {search_cache.ttl}s)\n"
+        f"• Hit: {search_cache.hits} | Miss: {search_cache.misses} | "
+        f"Hit rate: {_hit_rate(search_cache.hits, search_cache.misses)}\n\n"
+        f"💡 Jawaban {'(aktif)' if RESPONSE_CACHE else '(mati, set RESPONSE_CACHE=1)'} "
+        f"({len(response_cache)}/{response_cache.max_size}, TTL {response_cache.ttl}s)\n"
+        f"• Hit: {response_cache.hits} | Miss: {response_cache.misses} | "
+        f"Hit rate: {_hit_rate(response_cache.hits, response_cache.misses)}\n\n"
+        f"💬 Conversation ({len(conversation_cache)}/{conversation_cache.max_size})\n"
+        f"• Hit: {conversation_cache.hits} | Miss: {conversation_cache.misses} | "
+        f"Hit rate: {_hit_rate(conversation_cache.hits, conversation_cache.misses)}\n\n"
+        "Pakai /cache clear [search|respon] untuk kosongkan cache."
+    )
+
+# --- metrics: update masuk, nilai cache/antrian, /stats ---
+async def track_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Jalan di group -1 (sebelum handler lain): hitung update dan jeda penerimaannya."""
+    message = update.effective_message
+    if message is None:
+        UPDATES.inc(type="other")
+        return
+    UPDATES.inc(type="command" if message.text and message.text.startswith("/") else "message")
+    if message.date:
+        UPDATE_DELAY.observe(max(0.0, time.time() - message.date.timestamp()))
+
+metrics.callback(
+    "bot_cache_hits_total", "Cache hit", kind="counter", labelnames=("cache",),
+    fn=lambda: {
+        ("search",): search_cache.hits, ("response",): response_cache.hits,
+        ("conversation",): conversation_cache.hits,
+    },
+)
+metrics.callback(
+    "bot_cache_misses_total", "Cache miss", kind="counter", labelnames=("cache",),
+    fn=lambda: {
+        ("search",): search_cache.misses, ("response",): response_cache.misses,
+        ("conversation",): conversation_cache.misses,
+    },
+)
+metrics.callback(
+    "bot_cache_entries", "Jumlah entry di cache", labelnames=("cache",),
+    fn=lambda: {
+        ("search",): len(search_cache), ("response",): len(response_cache),
+        ("conversation",): len(conversation_cache),
+    },
+)
+metrics.callback(
+    "bot_singleflight_total", "Request single-flight: leader (call upstream) atau shared (ikut menunggu)",
+    kind="counter", labelnames=("flight", "result"),
+    fn=lambda: {(f.name, r): n for f in (search_flight, llm_flight) for r, n in f.stats.items()},
+)
+metrics.callback("bot_storage_queue_depth", "Operasi storage yang menunggu thread", fn=storage.queue_depth)
+metrics.callback(
+    "bot_scheduler_waiting", "Request yang menunggu di scheduler", labelnames=("lane",),
+    fn=lambda: {(name,): n for name, n in zip(LANE_NAMES, scheduler.lane_depths())},
+)
+metrics.callback("bot_scheduler_active", "Request yang sedang diproses scheduler", fn=lambda: scheduler.active)
+metrics.callback("bot_ratelimit_users", "User yang punya bucket rate limit", fn=lambda: len(limiter))
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin only: ringkasan latency per tahap, antrian, cache dan error."""
+    user = update.effective_user
+    username = f"@{user.username}" if user.username else user.first_name
+    
+    # Check admin
+    if username != ADMIN:
+        await update.message.reply_text("❌ Hanya admin yang bisa menggunakan command ini.")
+        return
+    
+    uptime = int(time.time() - metrics.REGISTRY.started)
+    lines = metrics.REGISTRY.summary_lines() or ["Belum ada data."]
+    text = (
+        f"📈 Statistik Bot (uptime {uptime // 3600}j {uptime % 3600 // 60}m)\n\n"
+        + "\n".join(lines)
+    )
+    for chunk in split_message(text):
+        await update.message.reply_text(chunk)
+
 # --- startup notification ---
 async def post_init(application: Application) -> None:
-    """Kirim notifikasi ke semua grup saat bot ready."""
-    groups = load_groups()
-    for chat_id in groups.keys():
-        try:
-            await application.bot.send_message(
-                chat_id=int(chat_id),
-                text="✅ <b>Bot Ready!</b>\n🤖 XMS AI sudah online dan siap digunakan.",
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            print(f"Failed to send ready message to {chat_id}: {e}")
+    """Cache identitas bot untuk filter, lalu kirim notifikasi ke semua grup saat bot ready."""
+    addressed_to_bot.load_identity(application.bot)
+    # Broadcast jalan di background supaya polling tidak menunggu
+    application.create_task(
+        broadcast(
+            application.bot,
+            group_registry.snapshot(),
+            "✅ <b>Bot Ready!</b>\n🤖 XMS AI sudah online dan siap digunakan.",
+            parse_mode="HTML"
+        )
+    )
+
+async def flush_groups_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job periodik: tulis grup baru/berubah ke storage dalam satu batch."""
+    await storage.flush_groups()
+
+async def refresh_settings_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job periodik: ambil disabled_modes terbaru (perubahan dari replica lain)."""
+    await storage.load_disabled_modes()
+
+async def cleanup_conversations_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job periodik: retention conversation (hapus message lebih tua dari TTL)."""
+    stats = await storage.cleanup_old_conversations()
+    print(f"🧹 Cleanup conversations: {stats['deleted']} message lewat TTL dihapus")
+
+async def post_shutdown(application: Application) -> None:
+    """Flush data yang tertunda, tutup thread pool storage dan koneksi LLM."""
+    await storage.flush_groups()
+    storage.shutdown()
+    await llm_router.close()
 
 # --- main ---
-if __name__ == "__main__":
-    app = Application.builder().token(TOKEN).build()
+def register_handlers(app: Application) -> Application:
+    """Daftarkan semua handler (dipakai juga oleh benchmarks/loadtest.py)."""
+    app.add_handler(TypeHandler(Update, track_update), group=-1)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("premium", premium_cmd))
+    app.add_handler(CommandHandler("setpremium", setpremium_cmd))
     app.add_handler(CommandHandler("ping", ping_cmd))
     app.add_handler(CommandHandler("anu", anu_cmd))
     app.add_handler(CommandHandler("reload", reload_cmd))
@@ -1351,10 +2228,25 @@ if __name__ == "__main__":
     app.add_handler(CommandHandler("off", off_mode_cmd))
     app.add_handler(CommandHandler("on", on_mode_cmd))
     app.add_handler(CommandHandler("status", status_cmd))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle))
+    app.add_handler(CommandHandler("cache", cache_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & addressed_to_bot, handle))
+    return app
+
+if __name__ == "__main__":
+    # Update diproses bareng; batas generasi LLM diatur scheduler, bukan PTB
+    app = register_handlers(
+        Application.builder().token(TOKEN).concurrent_updates(UPDATE_CONCURRENCY).build()
+    )
     
     # Tambahkan post_init untuk notifikasi startup
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
+    app.job_queue.run_repeating(refresh_settings_job, interval=SETTINGS_REFRESH_INTERVAL, first=SETTINGS_REFRESH_INTERVAL)
+    app.job_queue.run_repeating(cleanup_conversations_job, interval=CLEANUP_INTERVAL, first=60)
+    app.job_queue.run_repeating(flush_groups_job, interval=GROUPS_FLUSH_INTERVAL, first=GROUPS_FLUSH_INTERVAL)
+    limiter.start()
+    metrics.start_http_server()
     
     print("Bot Groq ready! Enjoy.")
-    app.run_polling()
+    webhook.run(app)
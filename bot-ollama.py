@@ -1,10 +1,6 @@
 #!/usr/bin/env python3
 
 import os
-import json
-import time
-import threading
-import requests
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -13,70 +9,48 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL = "llama3.2:1b"
+from ratelimit import RateLimiter
+from llm_providers import OllamaProvider
+from genqueue import GenerationQueue, QueueFull
+from streaming import stream_chunks_to_message
+import metrics
+import webhook
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")  # base URL server Ollama
+MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "1"))  # generasi paralel (sesuaikan VRAM/CPU)
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "20"))  # maksimal request yang menunggu
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "240"))
 ADMIN = os.getenv("ADMIN", "@GustyxPower") # Replace with your Telegram Username
 TOKEN = os.getenv("TOKEN") # Replace with your Telegram Bot Token
 DATA_FILE = "users.json"
 
-# --- persist user data ---
-lock = threading.Lock()
-
-def load():
-    with lock:
-        try:
-            return json.load(open(DATA_FILE))
-        except FileNotFoundError:
-            return {}
-
-def save(data):
-    with lock:
-        json.dump(data, open(DATA_FILE, "w"), indent=2)
+# --- rate limit (in-memory token bucket, snapshot periodik ke DATA_FILE) ---
+limiter = RateLimiter(limit=50, window=1800, path=DATA_FILE, admin=ADMIN)
 
 def can_use(uid, name):
-    data = load()
-    now = time.time()
-
-    if str(uid) not in data:
-        data[str(uid)] = {"count": 0, "reset": now + 1800, "premium": False}
-    u = data[str(uid)]
-
-    if now > u["reset"]:
-        u["count"] = 0
-        u["reset"] = now + 1800
-
-    if name == ADMIN:
-        u["premium"] = True
-
-    if u["premium"]:
-        save(data)
-        return True, u["count"]
+    return limiter.check(uid, name)
+
+# --- Ollama client (async, keep-alive, streaming NDJSON) ---
+ollama = OllamaProvider(
+    OLLAMA_URL,
+    options={
+        "num_gpu": int(os.getenv("OLLAMA_NUM_GPU", "99")),
+        "main_gpu": int(os.getenv("OLLAMA_MAIN_GPU", "0")),
+        "num_thread": int(os.getenv("OLLAMA_NUM_THREAD", str(os.cpu_count() or 4))),
+    },
+    timeout=OLLAMA_TIMEOUT,
+)
 
-    if u["count"] >= 50:
-        save(data)
-        return False, 50
+# Satu generasi lambat tidak lagi membekukan bot: request lain antri FIFO
+generation_queue = GenerationQueue(concurrency=OLLAMA_CONCURRENCY, max_waiting=OLLAMA_MAX_QUEUE)
+metrics.callback("bot_generation_queue_waiting", "Request yang antri slot Ollama", fn=lambda: generation_queue.waiting)
+metrics.callback("bot_generation_queue_active", "Generasi Ollama yang sedang jalan", fn=lambda: generation_queue.active)
 
-    u["count"] += 1
-    save(data)
-    return True, u["count"]
 
 def ask_ollama(prompt):
-    payload = {
-        "model": MODEL,
-        "prompt": prompt,
-        "options": {
-            "num_gpu": 99,  
-            "main_gpu": 0,     
-            "num_thread": 4     
-        },
-        "stream": False
-    }
-    try:
-        r = requests.post(OLLAMA_URL, json=payload, timeout=240)
-        return r.json().get("response", "🤖 Maaf, aku lagi error.")
-    except Exception as e:
-        return f"🤖 Error: {e}"
+    """Async iterator potongan jawaban dari Ollama."""
+    return ollama.stream(MODEL, [{"role": "user", "content": prompt}])
 
 # --- command /start  ---
 # Example Code
@@ -114,14 +88,35 @@ async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     prompt = update.message.text
-    reply = ask_ollama(prompt)
-    await update.message.reply_text(reply)
+    thinking_msg = await update.message.reply_text("🤖 Thinking...")
+
+    async def show_position(pos):
+        # Hanya dipanggil kalau harus menunggu slot (dan setiap posisinya maju)
+        try:
+            await thinking_msg.edit_text(f"⏳ You are #{pos} in the queue, please wait...")
+        except Exception:
+            pass  # Flood limit: posisi berikutnya menyusul
+
+    try:
+        async with generation_queue.slot(show_position):
+            reply, coalescer = await stream_chunks_to_message(ask_ollama(prompt), thinking_msg, context.bot)
+            await coalescer.finish(reply[:4000] if reply else "🤖 Sorry, something went wrong.")
+    except QueueFull:
+        await thinking_msg.edit_text("🚦 The queue is full right now, please try again in a moment.")
+    except Exception as e:
+        await thinking_msg.edit_text(f"🤖 Error: {e}")
+
+async def post_shutdown(application: Application) -> None:
+    """Tutup koneksi keep-alive ke Ollama."""
+    await ollama.close()
 
 # --- main ---
 if __name__ == "__main__":
-    app = Application.builder().token(TOKEN).build()
+    app = Application.builder().token(TOKEN).concurrent_updates(True).post_shutdown(post_shutdown).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("premium", premium_cmd))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle))
     print("Bot Telegram + Ollama (GPU-offload) ready. Enjoy!")
-    app.run_polling()
\ No newline at end of file
+    limiter.start()
+    metrics.start_http_server()
+    webhook.run(app)
\ No newline at end of file
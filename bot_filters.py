@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Filter PTB untuk pesan yang ditujukan ke bot (mention / reply).
+
+Identitas bot (username & id) di-cache sekali saat startup, jadi pesan grup
+yang tidak menyebut bot langsung ditolak di level filter tanpa network call
+(dulu setiap pesan memanggil get_me() dulu).
+"""
+
+from telegram.ext import filters
+
+
+class AddressedToBot(filters.MessageFilter):
+    """Lolos kalau teks mengandung @username bot atau reply ke pesan bot."""
+
+    def __init__(self):
+        super().__init__(name="AddressedToBot")
+        self.mention = ""
+        self.bot_id = None
+
+    def set_identity(self, username: str, bot_id: int):
+        self.mention = f"@{username}" if username else ""
+        self.bot_id = bot_id
+
+    def load_identity(self, bot):
+        """Panggil dari post_init: setelah initialize(), bot.username & bot.id sudah ter-cache."""
+        self.set_identity(bot.username, bot.id)
+
+    def filter(self, message) -> bool:
+        if self.mention and message.text and self.mention in message.text:
+            return True
+        reply = message.reply_to_message
+        return bool(
+            reply is not None
+            and reply.from_user is not None
+            and reply.from_user.id == self.bot_id
+        )
+
+    def strip_mention(self, text: str) -> str:
+        return text.replace(self.mention, "").strip() if self.mention else text.strip()
+
+
+addressed_to_bot = AddressedToBot()
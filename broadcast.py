@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Broadcast engine untuk kirim pengumuman ke semua grup (maintenance.py,
+done-mt.py, dan notifikasi "Bot Ready!" di bot-groq.py).
+
+- Kirim paralel tapi tetap di bawah limit Telegram (global ~30 pesan/detik).
+- RetryAfter dihormati: semua worker pause selama retry_after, lalu retry.
+- Daftar grup diambil per halaman dari Supabase (fallback groups.json).
+- Progress di-checkpoint per chat, jadi run yang terputus bisa dilanjutkan.
+- Hasil per chat dikembalikan: sent / forbidden / failed: <error>.
+"""
+
+import os
+import json
+import time
+import asyncio
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # pesan per detik (global)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_MAX_RETRIES = 3
+GROUPS_PAGE_SIZE = 1000
+
+
+def connect_supabase():
+    """Buat client Supabase dari env SUPABASE_URL / SUPABASE_KEY (None kalau tidak ada)."""
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not (url and key):
+        return None
+    try:
+        from supabase import create_client
+        return create_client(url, key)
+    except Exception as e:
+        print(f"⚠️ Supabase connection failed: {e}")
+        return None
+
+
+def load_all_groups(supabase=None, groups_file: str = "groups.json", page_size: int = GROUPS_PAGE_SIZE) -> dict:
+    """Ambil semua grup {chat_id: title}, dari Supabase per halaman; fallback ke JSON."""
+    if supabase:
+        groups = {}
+        start = 0
+        try:
+            while True:
+                result = (
+                    supabase.table("groups")
+                    .select("chat_id, title")
+                    .order("chat_id")
+                    .range(start, start + page_size - 1)
+                    .execute()
+                )
+                for row in result.data:
+                    groups[str(row["chat_id"])] = row["title"]
+                if len(result.data) < page_size:
+                    return groups
+                start += page_size
+        except Exception as e:
+            print(f"Supabase groups error: {e}")
+    try:
+        with open(groups_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+class RateGate:
+    """Limiter global: maksimal `rate` pemanggilan per detik, bisa di-pause (RetryAfter)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _retry_seconds(e: RetryAfter) -> float:
+    retry = e.retry_after
+    return retry.total_seconds() if hasattr(retry, "total_seconds") else float(retry)
+
+
+class Checkpoint:
+    """File append-only: satu baris `chat_id<TAB>status` per chat yang sudah selesai."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.done = {}
+        self._f = None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    chat_id, _, status = line.rstrip("\n").partition("\t")
+                    if chat_id:
+                        self.done[chat_id] = status
+        if path:
+            self._f = open(path, "a", buffering=1)
+
+    def record(self, chat_id: str, status: str):
+        self.done[chat_id] = status
+        if self._f:
+            self._f.write(f"{chat_id}\t{status}\n")
+
+    def close(self, completed: bool):
+        if self._f:
+            self._f.close()
+            # Run selesai: hapus checkpoint supaya broadcast berikutnya mulai dari awal
+            if completed:
+                os.remove(self.path)
+
+
+async def _send_one(bot, chat_id: str, text: str, gate: RateGate, max_retries: int, **kwargs) -> str:
+    for attempt in range(max_retries + 1):
+        await gate.wait()
+        try:
+            await bot.send_message(chat_id=int(chat_id), text=text, **kwargs)
+            return "sent"
+        except RetryAfter as e:
+            # Flood limit global: pause semua worker, lalu coba lagi
+            gate.pause(_retry_seconds(e))
+        except Forbidden as e:
+            return f"forbidden: {e}"
+        except BadRequest as e:
+            return f"failed: {e}"
+        except (TimedOut, NetworkError) as e:
+            if attempt == max_retries:
+                return f"failed: {e}"
+            await asyncio.sleep(2 ** attempt)
+        except Exception as e:
+            return f"failed: {e}"
+    return "failed: retry limit"
+
+
+async def broadcast(bot, groups: dict, text: str, checkpoint: str = None,
+                    rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY,
+                    max_retries: int = BROADCAST_MAX_RETRIES, verbose: bool = True, **kwargs) -> dict:
+    """
+    Kirim `text` ke semua grup ({chat_id: title}). kwargs diteruskan ke send_message
+    (mis. parse_mode). Return {chat_id: status}, termasuk hasil dari run sebelumnya
+    kalau dilanjutkan dari checkpoint.
+    """
+    cp = Checkpoint(checkpoint)
+    results = dict(cp.done)
+    pending = [(cid, title) for cid, title in groups.items() if str(cid) not in cp.done]
+    if cp.done and verbose:
+        print(f"↩️ Resume: {len(cp.done)} grup sudah diproses, sisa {len(pending)}")
+
+    gate = RateGate(rate)
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+
+    async def worker():
+        while True:
+            try:
+                chat_id, title = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            status = await _send_one(bot, str(chat_id), text, gate, max_retries, **kwargs)
+            results[str(chat_id)] = status
+            cp.record(str(chat_id), status)
+            if verbose:
+                icon = "✅" if status == "sent" else "❌"
+                print(f"{icon} {title} ({chat_id}): {status}")
+
+    started = time.monotonic()
+    completed = False
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(pending))))))
+        completed = True
+    finally:
+        cp.close(completed)
+
+    if verbose:
+        sent = sum(1 for s in results.values() if s == "sent")
+        print(
+            f"📣 Broadcast selesai: {sent}/{len(results)} terkirim "
+            f"dalam {time.monotonic() - started:.1f}s"
+        )
+    return results
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Formatting engine untuk jawaban LLM.
+
+Output LLM di-tokenize SEKALI (scan linear, tanpa regex yang bisa backtrack),
+lalu token stream yang sama bisa di-render jadi plain text atau HTML Telegram.
+Menggantikan rantai strip_markdown / markdown_to_html / sanitize_html /
+convert_markdown_tables yang dulu bikin 5-8 pass regex per jawaban.
+"""
+
+import html
+
+# --- token kinds ---
+TEXT = "text"        # (TEXT, str)
+OPEN = "open"        # (OPEN, tag)
+CLOSE = "close"      # (CLOSE, tag)
+CODE = "code"        # (CODE, str)            `inline`
+PRE = "pre"          # (PRE, lang, str)       ```block```
+LINK = "link"        # (LINK, text, url)      [text](url)
+TABLE = "table"      # (TABLE, headers, rows)
+NEWLINE = "nl"       # (NEWLINE,)
+
+# Marker inline -> tag internal (dipetakan ke tag HTML di _HTML_TAGS)
+_MARKER_TAGS = {"**": "b", "__": "u", "*": "i", "_": "i_"}
+_HTML_TAGS = {"b": "b", "u": "u", "i": "i", "i_": "i"}
+_MAX_HEADER_LEVEL = 6
+
+
+def _is_table_separator(line: str) -> bool:
+    s = line.strip()
+    return (
+        len(s) >= 3 and s[0] == "|" and s[-1] == "|" and "-" in s
+        and all(c in "|-: \t" for c in s)
+    )
+
+
+def _is_table_row(line: str) -> bool:
+    s = line.strip()
+    return len(s) >= 2 and s[0] == "|" and s[-1] == "|"
+
+
+def _split_row(line: str) -> list:
+    return [c.strip() for c in line.strip().split("|") if c.strip()]
+
+
+def _heading_level(line: str) -> int:
+    """Jumlah '#' kalau baris adalah header markdown ('# Judul'), selain itu 0."""
+    level = 0
+    while level < len(line) and line[level] == "#":
+        level += 1
+    if 1 <= level <= _MAX_HEADER_LEVEL and level < len(line) and line[level] in " \t":
+        return level
+    return 0
+
+
+def _tokenize_inline(s: str, out: list):
+    """Tokenize satu baris. Linear: posisi 'next marker' di-cache dan hanya maju."""
+    n = len(s)
+    next_pos = {}
+
+    def find(marker: str, pos: int) -> int:
+        cached = next_pos.get(marker)
+        if cached is None or (cached != -1 and cached < pos):
+            cached = s.find(marker, pos)
+            next_pos[marker] = cached
+        return cached
+
+    stack = []
+    buf = []
+    i = 0
+
+    def flush():
+        if buf:
+            out.append((TEXT, "".join(buf)))
+            buf.clear()
+
+    while i < n:
+        c = s[i]
+
+        if c == "`":
+            j = find("`", i + 1)
+            if j > i + 1:
+                flush()
+                out.append((CODE, s[i + 1:j]))
+                i = j + 1
+                continue
+
+        elif c == "[":
+            j = find("]", i + 1)
+            if j > i + 1 and j + 1 < n and s[j + 1] == "(":
+                k = find(")", j + 2)
+                if k > j + 2:
+                    flush()
+                    out.append((LINK, s[i + 1:j], s[j + 2:k]))
+                    i = k + 1
+                    continue
+
+        elif c == "*" or c == "_":
+            double = c + c
+            marker = double if s.startswith(double, i) else c
+            tag = _MARKER_TAGS[marker]
+            after = i + len(marker)
+            if tag in stack:
+                # Underscore hanya menutup kalau tidak diikuti huruf (snake_case aman)
+                if not (c == "_" and after < n and s[after].isalnum()):
+                    flush()
+                    # Tutup tag di atasnya dulu, lalu buka lagi supaya HTML tetap valid
+                    reopen = []
+                    while stack[-1] != tag:
+                        reopen.append(stack.pop())
+                        out.append((CLOSE, reopen[-1]))
+                    stack.pop()
+                    out.append((CLOSE, tag))
+                    for t in reversed(reopen):
+                        stack.append(t)
+                        out.append((OPEN, t))
+                    i = after
+                    continue
+            elif not (c == "_" and i > 0 and s[i - 1].isalnum()):
+                # Buka hanya kalau ada marker penutup di baris yang sama
+                if after < n and not s[after].isspace() and find(marker, after + 1) != -1:
+                    flush()
+                    stack.append(tag)
+                    out.append((OPEN, tag))
+                    i = after
+                    continue
+            # Bukan formatting: simpan marker apa adanya
+            buf.append(marker)
+            i = after
+            continue
+
+        buf.append(c)
+        i += 1
+
+    flush()
+    # Marker yang tidak ditutup sampai akhir baris: tutup supaya HTML valid
+    while stack:
+        out.append((CLOSE, stack.pop()))
+
+
+def tokenize_markdown(text: str) -> list:
+    """Ubah teks markdown-ish dari LLM jadi list token (satu pass per baris)."""
+    tokens = []
+    lines = text.split("\n")
+    n = len(lines)
+    i = 0
+    while i < n:
+        line = lines[i]
+        stripped = line.lstrip()
+
+        if stripped.startswith("```"):
+            rest = stripped[3:]
+            end = rest.find("```")
+            if end != -1:
+                # ```kode``` dalam satu baris
+                tokens.append((PRE, "", rest[:end]))
+                tail = rest[end + 3:]
+                if tail.strip():
+                    _tokenize_inline(tail, tokens)
+                i += 1
+            else:
+                lang = rest.strip()
+                j = i + 1
+                while j < n and not lines[j].lstrip().startswith("```"):
+                    j += 1
+                # Fence yang belum ditutup (mis. jawaban streaming parsial) -> sampai akhir
+                tokens.append((PRE, lang, "\n".join(lines[i + 1:j])))
+                i = j + 1
+            if i < n:
+                tokens.append((NEWLINE,))
+            continue
+
+        if _is_table_row(line) and i + 1 < n and _is_table_separator(lines[i + 1]):
+            headers = _split_row(line)
+            rows = []
+            j = i + 2
+            while j < n and _is_table_row(lines[j]):
+                cells = _split_row(lines[j])
+                if cells:
+                    rows.append(cells)
+                j += 1
+            tokens.append((TABLE, headers, rows))
+            i = j
+            if i < n:
+                tokens.append((NEWLINE,))
+            continue
+
+        level = _heading_level(stripped)
+        if level:
+            tokens.append((OPEN, "b"))
+            _tokenize_inline(stripped[level:].strip(), tokens)
+            tokens.append((CLOSE, "b"))
+        elif stripped.startswith("> ") or stripped.startswith(">\t"):
+            _tokenize_inline(stripped[2:], tokens)
+        else:
+            _tokenize_inline(line, tokens)
+
+        i += 1
+        if i < n:
+            tokens.append((NEWLINE,))
+    return tokens
+
+
+def render_plain(tokens: list) -> str:
+    """Render token jadi plain text: semua marker markdown dibuang."""
+    out = []
+    for tok in tokens:
+        kind = tok[0]
+        if kind == TEXT or kind == CODE:
+            out.append(tok[1])
+        elif kind == NEWLINE:
+            out.append("\n")
+        elif kind == PRE:
+            out.append(tok[2])
+        elif kind == LINK:
+            out.append(tok[1])
+        elif kind == TABLE:
+            out.append(_render_table(tok[1], tok[2], html_mode=False))
+    return "".join(out).strip()
+
+
+def render_html(tokens: list) -> str:
+    """Render token jadi HTML Telegram (b, i, u, code, pre, a) dengan escaping benar."""
+    esc = html.escape
+    out = []
+    for tok in tokens:
+        kind = tok[0]
+        if kind == TEXT:
+            out.append(esc(tok[1], quote=False))
+        elif kind == NEWLINE:
+            out.append("\n")
+        elif kind == OPEN:
+            out.append(f"<{_HTML_TAGS[tok[1]]}>")
+        elif kind == CLOSE:
+            out.append(f"</{_HTML_TAGS[tok[1]]}>")
+        elif kind == CODE:
+            out.append(f"<code>{esc(tok[1], quote=False)}</code>")
+        elif kind == PRE:
+            lang, code = tok[1], esc(tok[2], quote=False)
+            if lang:
+                out.append(f'<pre><code class="language-{esc(lang)}">{code}</code></pre>')
+            else:
+                out.append(f"<pre>{code}</pre>")
+        elif kind == LINK:
+            text, url = tok[1], tok[2].strip()
+            if url.startswith(("http://", "https://")):
+                out.append(f'<a href="{esc(url)}">{esc(text, quote=False)}</a>')
+            else:
+                out.append(esc(text, quote=False))
+        elif kind == TABLE:
+            out.append(_render_table(tok[1], tok[2], html_mode=True))
+
+    # Rapikan: trailing space per baris dan maksimal 2 newline berturut-turut
+    lines = []
+    blank = 0
+    for line in "".join(out).split("\n"):
+        line = line.rstrip()
+        blank = blank + 1 if not line else 0
+        if blank <= 1:
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def _render_table(headers: list, rows: list, html_mode: bool) -> str:
+    """Tabel markdown -> daftar 'Header: isi' per baris (lebih enak dibaca di HP)."""
+    esc = html.escape
+    parts = []
+    for row in rows:
+        for header, cell in zip(headers, row):
+            if not cell:
+                continue
+            if html_mode:
+                parts.append(f"<b>{esc(header, quote=False)}:</b> {esc(cell, quote=False)}")
+            else:
+                parts.append(f"{header}: {cell}")
+        parts.append("")
+    return "\n".join(parts).rstrip("\n")
+
+
+def strip_markdown(text: str) -> str:
+    """Strip all markdown formatting untuk output plain text yang bersih."""
+    return render_plain(tokenize_markdown(text))
+
+
+def markdown_to_html(text: str) -> str:
+    """Convert markdown formatting ke HTML untuk Telegram."""
+    return render_html(tokenize_markdown(text))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Antrian terbatas untuk generasi LLM yang mahal (Ollama lokal, request Groq).
+
+Maksimal `concurrency` generasi jalan bareng; sisanya menunggu di lane
+prioritas masing-masing (lane 0 paling prioritas, FIFO di dalam lane).
+- Setiap lane punya batas antrian sendiri (`max_waiting`, int untuk semua
+  lane atau list per lane). Kalau lane penuh, request baru langsung ditolak
+  (QueueFull); lane free yang penuh tidak menutup jalan lane admin/premium.
+- Load shedding: lane di `shed_after` ditolak di depan (Overloaded) kalau
+  estimasi waktu tunggunya melebihi batas. Estimasi = posisi / concurrency
+  x rata-rata durasi slot (EWMA, mulai dari `service_estimate`).
+Posisi antrian bisa dilaporkan ke user lewat callback `on_position`.
+"""
+
+import math
+import time
+import asyncio
+from collections import deque
+
+
+class QueueFull(Exception):
+    """Antrian penuh, request ditolak."""
+
+
+class Overloaded(QueueFull):
+    """Estimasi waktu tunggu melebihi batas lane (load shedding)."""
+
+
+class GenerationQueue:
+    def __init__(self, concurrency: int = 1, max_waiting=20, position_interval: float = 2.0,
+                 lanes: int = 1, shed_after: dict = None, service_alpha: float = 0.2,
+                 service_estimate: float = None):
+        self.concurrency = max(1, concurrency)
+        lanes = max(1, lanes)
+        if isinstance(max_waiting, int):
+            max_waiting = [max_waiting] * lanes
+        self.max_waiting = list(max_waiting)  # batas antrian per lane
+        self.position_interval = position_interval
+        self.shed_after = shed_after or {}  # lane -> detik estimasi tunggu maksimum
+        self.service_alpha = service_alpha
+        # EWMA durasi slot (detik); diisi tebakan awal supaya shedding jalan sejak cold start
+        self.avg_service = service_estimate
+        self.active = 0
+        self.shed = 0
+        self._lanes = [deque() for _ in range(lanes)]  # Future per request yang menunggu
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def lane_depths(self) -> list:
+        return [len(lane) for lane in self._lanes]
+
+    def _position(self, fut, lane: int) -> int:
+        ahead = sum(len(l) for l in self._lanes[:lane])
+        return ahead + self._lanes[lane].index(fut) + 1
+
+    def estimated_wait(self, position: int) -> float:
+        """Estimasi detik sampai request di posisi `position` dapat slot."""
+        if self.avg_service is None:
+            return 0.0
+        return math.ceil(position / self.concurrency) * self.avg_service
+
+    async def acquire(self, on_position=None, lane: int = 0):
+        """
+        Tunggu sampai dapat slot. `on_position(pos)` (async) dipanggil setiap posisi
+        antrian berubah (1 = berikutnya). Raise QueueFull / Overloaded kalau ditolak.
+        """
+        lane = min(max(lane, 0), len(self._lanes) - 1)
+        if self.active < self.concurrency and not self.waiting:
+            self.active += 1
+            return
+        if len(self._lanes[lane]) >= self.max_waiting[lane]:
+            raise QueueFull(f"{len(self._lanes[lane])} request sedang menunggu di lane {lane}")
+        limit = self.shed_after.get(lane)
+        if limit is not None:
+            # Posisi kalau masuk sekarang: semua lane yang sama/lebih prioritas + 1
+            position = sum(len(l) for l in self._lanes[:lane + 1]) + 1
+            if self.estimated_wait(position) > limit:
+                self.shed += 1
+                raise Overloaded(f"estimasi tunggu {self.estimated_wait(position):.0f}s")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(fut)
+        last = None
+        try:
+            while True:
+                if on_position:
+                    pos = self._position(fut, lane)
+                    if pos != last:
+                        last = pos
+                        await on_position(pos)
+                try:
+                    # Slot diberikan langsung oleh release() (active tidak berubah)
+                    await asyncio.wait_for(asyncio.shield(fut), timeout=self.position_interval)
+                    return
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self.release()  # Slot sudah diberikan tapi pemanggil batal
+            else:
+                fut.cancel()
+                try:
+                    self._lanes[lane].remove(fut)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, duration: float = None):
+        """Lepas slot: langsung oper ke request terdepan di lane paling prioritas."""
+        if duration is not None:
+            if self.avg_service is None:
+                self.avg_service = duration
+            else:
+                self.avg_service += self.service_alpha * (duration - self.avg_service)
+        for lane in self._lanes:
+            while lane:
+                fut = lane.popleft()
+                if not fut.done():
+                    fut.set_result(None)
+                    return
+        self.active -= 1
+
+    def slot(self, on_position=None, lane: int = 0):
+        return _Slot(self, on_position, lane)
+
+
+class _Slot:
+    """`async with queue.slot(on_position, lane): ...`"""
+
+    def __init__(self, queue: GenerationQueue, on_position, lane: int):
+        self.queue = queue
+        self.on_position = on_position
+        self.lane = lane
+        self.started = None
+
+    async def __aenter__(self):
+        await self.queue.acquire(self.on_position, self.lane)
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.queue.release(time.monotonic() - self.started)
+        return False
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Satu interface untuk semua backend LLM (Groq, Gemini, Ollama) + routing per mode.
+
+Provider cukup implement `stream(model, messages, **kwargs)` yang yield potongan
+teks. LLMRouter memilih route dari tabel per mode:
+- failover: kalau route error / belum kirim token pertama sampai timeout,
+  lanjut ke route berikutnya;
+- hedging (opsional): kalau route utama belum kirim token pertama setelah
+  melewati persentil latency-nya (mis. p95), route cadangan ikut dijalankan
+  dan yang duluan menjawab yang dipakai.
+
+Messages pakai format OpenAI: [{"role": "system"|"user"|"assistant", "content": str}].
+"""
+
+import os
+import json
+import time
+import asyncio
+from collections import deque
+
+import httpx
+
+import metrics
+
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+
+# --- Metrics (label model = "provider:model") ---
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "bot_llm_first_token_seconds", "Waktu sampai token pertama per route LLM", ("model",)
+)
+LLM_SECONDS = metrics.histogram(
+    "bot_llm_seconds", "Durasi total streaming jawaban per route LLM", ("model",)
+)
+LLM_INFLIGHT = metrics.gauge(
+    "bot_llm_inflight", "Request LLM yang sedang jalan/menunggu semaphore", ("model",)
+)
+LLM_ERRORS = metrics.counter(
+    "bot_llm_errors_total", "Route LLM yang gagal (error atau timeout token pertama)", ("model", "kind")
+)
+LLM_ROUTER_EVENTS = metrics.counter(
+    "bot_llm_router_events_total", "Failover dan hedge yang dilakukan router", ("event",)
+)
+
+
+class ProviderError(Exception):
+    """Error dari provider (HTTP error, respons kosong, dll)."""
+
+
+# --- Providers ---
+class Provider:
+    name = "base"
+
+    async def stream(self, model: str, messages: list, **kwargs):
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def complete(self, model: str, messages: list, **kwargs) -> str:
+        return "".join([chunk async for chunk in self.stream(model, messages, **kwargs)])
+
+    async def close(self):
+        pass
+
+
+class GroqProvider(Provider):
+    """Groq / OpenAI-compatible lewat AsyncOpenAI (client & semaphore dari pemanggil)."""
+
+    name = "groq"
+
+    def __init__(self, client, semaphore_for=None):
+        self.client = client
+        self.semaphore_for = semaphore_for
+
+    async def stream(self, model: str, messages: list, **kwargs):
+        sem = self.semaphore_for(model) if self.semaphore_for else None
+        if sem:
+            await sem.acquire()
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                **kwargs
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            if sem:
+                sem.release()
+
+    async def close(self):
+        await self.client.close()
+
+
+class GeminiProvider(Provider):
+    """Google Gemini (google-generativeai). Instance GenerativeModel di-cache per model."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = None):
+        import google.generativeai as genai  # optional dependency
+        self.genai = genai
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._models = {}
+
+    def model(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            model = self._models[name] = self.genai.GenerativeModel(name)
+        return model
+
+    @staticmethod
+    def to_contents(messages: list) -> list:
+        """OpenAI messages -> Gemini contents. System prompt digabung ke turn user pertama."""
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = []
+        for m in messages:
+            if m["role"] == "system":
+                continue
+            role = "model" if m["role"] == "assistant" else "user"
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].append(m["content"])
+            else:
+                contents.append({"role": role, "parts": [m["content"]]})
+        if system:
+            if contents and contents[0]["role"] == "user":
+                contents[0]["parts"].insert(0, system)
+            else:
+                contents.insert(0, {"role": "user", "parts": [system]})
+        return contents
+
+    async def stream(self, model: str, messages: list, max_tokens: int = None,
+                     temperature: float = None, top_p: float = None, **kwargs):
+        config = {}
+        if max_tokens:
+            config["max_output_tokens"] = max_tokens
+        if temperature is not None:
+            config["temperature"] = temperature
+        if top_p is not None:
+            config["top_p"] = top_p
+        response = await self.model(model).generate_content_async(
+            self.to_contents(messages),
+            generation_config=config or None,
+            stream=True,
+        )
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk tanpa teks (mis. diblokir safety filter)
+            if text:
+                yield text
+
+
+class OllamaProvider(Provider):
+    """Ollama lokal lewat /api/chat (NDJSON streaming) dengan koneksi keep-alive."""
+
+    name = "ollama"
+
+    def __init__(self, base_url: str = "http://localhost:11434", options: dict = None,
+                 timeout: float = 240, client: httpx.AsyncClient = None):
+        self.base_url = base_url.rstrip("/")
+        self.options = options or {}
+        self.client = client or httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=10),
+            limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+        )
+
+    async def stream(self, model: str, messages: list, max_tokens: int = None,
+                     temperature: float = None, top_p: float = None, **kwargs):
+        options = dict(self.options)
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        if temperature is not None:
+            options["temperature"] = temperature
+        if top_p is not None:
+            options["top_p"] = top_p
+        payload = {"model": model, "messages": messages, "stream": True, "options": options}
+        async with self.client.stream("POST", f"{self.base_url}/api/chat", json=payload) as r:
+            if r.status_code != 200:
+                body = (await r.aread()).decode(errors="replace")
+                raise ProviderError(f"Ollama HTTP {r.status_code}: {body[:200]}")
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise ProviderError(f"Ollama: {data['error']}")
+                text = (data.get("message") or {}).get("content") or data.get("response")
+                if text:
+                    yield text
+                if data.get("done"):
+                    return
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# --- Routing ---
+class Route:
+    __slots__ = ("provider", "model")
+
+    def __init__(self, provider: Provider, model: str):
+        self.provider = provider
+        self.model = model
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider.name}:{self.model}"
+
+    def __repr__(self):
+        return f"Route({self.key})"
+
+
+class LatencyTracker:
+    """Simpan N sampel time-to-first-token terakhir untuk hitung persentil."""
+
+    def __init__(self, maxlen: int = 200):
+        self.samples = deque(maxlen=maxlen)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[idx]
+
+
+class LLMRouter:
+    """Tabel routing per mode dengan failover dan hedged request."""
+
+    def __init__(self, table: dict, first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT,
+                 hedge: bool = LLM_HEDGE, hedge_percentile: float = LLM_HEDGE_PERCENTILE):
+        self.table = table  # mode -> [Route, ...]
+        self.first_token_timeout = first_token_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.latency = {}  # route key -> LatencyTracker
+        self.stats = {"failovers": 0, "hedges": 0, "errors": 0}
+
+    def routes(self, mode: str) -> list:
+        return self.table.get(mode) or next(iter(self.table.values()))
+
+    def primary(self, mode: str) -> Route:
+        return self.routes(mode)[0]
+
+    def _tracker(self, route: Route) -> LatencyTracker:
+        tracker = self.latency.get(route.key)
+        if tracker is None:
+            tracker = self.latency[route.key] = LatencyTracker()
+        return tracker
+
+    def _hedge_delay(self, route: Route):
+        if not self.hedge:
+            return None
+        tracker = self._tracker(route)
+        if len(tracker.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return tracker.percentile(self.hedge_percentile)
+
+    async def stream(self, mode: str, messages: list, **kwargs):
+        """
+        Yield potongan teks dari route pertama yang berhasil kirim token pertama.
+        Setelah token pertama, route itu dipakai sampai selesai (tidak ganti di tengah jawaban).
+        """
+        routes = self.routes(mode)
+        attempts = {}  # task(__anext__) -> (route, agen, started)
+        next_idx = 0
+        last_error = None
+
+        def launch():
+            nonlocal next_idx
+            route = routes[next_idx]
+            next_idx += 1
+            agen = self._instrumented(route, messages, kwargs)
+            task = asyncio.ensure_future(agen.__anext__())
+            attempts[task] = (route, agen, time.monotonic())
+
+        launch()
+        winner = None
+        first = None
+        try:
+            while attempts and winner is None:
+                now = time.monotonic()
+                deadline = min(started + self.first_token_timeout for _, _, started in attempts.values())
+                hedge_at = None
+                if len(attempts) == 1 and next_idx < len(routes):
+                    route, _, started = next(iter(attempts.values()))
+                    delay = self._hedge_delay(route)
+                    if delay is not None:
+                        hedge_at = started + delay
+                wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+                done, _ = await asyncio.wait(
+                    attempts, timeout=max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    route, agen, started = attempts.pop(task)
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        last_error = ProviderError(f"{route.key}: respons kosong")
+                        LLM_ERRORS.inc(model=route.key, kind="empty")
+                    except Exception as e:
+                        last_error = e
+                        self.stats["errors"] += 1
+                        LLM_ERRORS.inc(model=route.key, kind="error")
+                        print(f"⚠️ LLM {route.key} error: {e}")
+                    else:
+                        if winner is None:
+                            winner = (route, agen)
+                            first = chunk
+                            self._tracker(route).add(time.monotonic() - started)
+                            continue
+                    # Gagal, atau kalah balapan di iterasi yang sama
+                    await agen.aclose()
+
+                if winner is not None:
+                    break
+
+                now = time.monotonic()
+                for task, (route, agen, started) in list(attempts.items()):
+                    if now - started >= self.first_token_timeout:
+                        attempts.pop(task)
+                        task.cancel()
+                        last_error = asyncio.TimeoutError(f"{route.key}: timeout token pertama")
+                        self.stats["errors"] += 1
+                        LLM_ERRORS.inc(model=route.key, kind="timeout")
+                        print(f"⚠️ LLM {route.key} timeout")
+
+                if next_idx < len(routes):
+                    if not attempts:
+                        self.stats["failovers"] += 1
+                        LLM_ROUTER_EVENTS.inc(event="failover")
+                        launch()
+                    elif hedge_at is not None and now >= hedge_at:
+                        self.stats["hedges"] += 1
+                        LLM_ROUTER_EVENTS.inc(event="hedge")
+                        launch()
+        finally:
+            # Batalkan attempt yang kalah
+            for task, (route, agen, _) in attempts.items():
+                task.cancel()
+            attempts.clear()
+
+        if winner is None:
+            raise last_error or ProviderError("Semua provider gagal")
+
+        route, agen = winner
+        yield first
+        try:
+            async for chunk in agen:
+                yield chunk
+        finally:
+            await agen.aclose()
+
+    async def _instrumented(self, route: Route, messages: list, kwargs: dict):
+        """provider.stream() + metrics: in-flight, time-to-first-token, durasi total."""
+        LLM_INFLIGHT.inc(model=route.key)
+        started = time.perf_counter()
+        first = True
+        try:
+            async for chunk in route.provider.stream(route.model, messages, **kwargs):
+                if first:
+                    first = False
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, model=route.key)
+                yield chunk
+            LLM_SECONDS.observe(time.perf_counter() - started, model=route.key)
+        finally:
+            LLM_INFLIGHT.dec(model=route.key)
+
+    async def complete(self, mode: str, messages: list, **kwargs) -> str:
+        return "".join([chunk async for chunk in self.stream(mode, messages, **kwargs)])
+
+    async def close(self):
+        providers = {id(r.provider): r.provider for routes in self.table.values() for r in routes}
+        for provider in providers.values():
+            await provider.close()
+
+
+def parse_routes(spec: str, providers: dict) -> list:
+    """'groq:llama-3.3-70b-versatile,gemini:gemini-1.5-flash' -> [Route, Route]."""
+    routes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, model = item.partition(":")
+        provider = providers.get(name)
+        if provider is None or not model:
+            print(f"⚠️ Route '{item}' diabaikan (provider tidak tersedia)")
+            continue
+        routes.append(Route(provider, model))
+    return routes
@@ -4,11 +4,10 @@ Send maintenance message to all groups where the bot is present.
 Run once: ./run-mt
 """
 import os
-import json
 import asyncio
 from telegram import constants
-from telegram.error import Forbidden, RetryAfter
 from telegram.ext import Application
+from broadcast import broadcast, connect_supabase, load_all_groups
 
 TOKEN = os.getenv("TOKEN", "your-bot-token")
 MSG = (
@@ -23,17 +22,11 @@ async def main():
     app = Application.builder().token(TOKEN).build()
     await app.initialize()
     async with app:
-        try:
-            with open("groups.json") as f:
-                groups = json.load(f)
-        except FileNotFoundError:
+        groups = load_all_groups(connect_supabase())
+        if not groups:
             print("No groups saved yet.")
             return
-        for gid, title in groups.items():
-            try:
-                await app.bot.send_message(int(gid), MSG, parse_mode="Markdown")
-                print(f"✅ Sent to {title} ({gid})")
-            except Exception as e:
-                print(f"❌ Failed to send to {gid}: {e}")
+        # Kalau terputus, jalankan ulang: grup yang sudah terkirim di-skip
+        await broadcast(app.bot, groups, MSG, checkpoint="maintenance.checkpoint", parse_mode="Markdown")
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Metrics registry kecil (tanpa dependency) dengan format Prometheus.
+
+- Counter / Gauge / Histogram dengan label, aman dipakai dari thread pool
+  (storage) maupun event loop.
+- Callback: nilai diambil saat scrape (ukuran cache, kedalaman antrian, dll).
+- `start_http_server(port)` expose /metrics; `summary_lines()` untuk /stats.
+"""
+
+import os
+import time
+import bisect
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = endpoint HTTP mati
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple, key: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def items(self) -> list:
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Callback(_Metric):
+    """Nilai dihitung saat scrape. fn() -> angka, atau {label_tuple: angka}."""
+
+    def __init__(self, name, help, fn, kind: str = "gauge", labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def items(self) -> list:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return sorted((tuple(str(x) for x in k), v) for k, v in value.items())
+        return [((), value)]
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [counts per bucket (+Inf terakhir), sum, count, max]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+            if value > series[3]:
+                series[3] = value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def timed(self, **labels):
+        """Decorator untuk fungsi async: catat durasi setiap pemanggilan."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def series(self) -> list:
+        with self._lock:
+            return sorted((k, (list(s[0]), s[1], s[2], s[3])) for k, s in self._series.items())
+
+    def quantile(self, q: float, counts: list, total: int, maximum: float = None) -> float:
+        """
+        Estimasi kuantil dari bucket (interpolasi linear, seperti histogram_quantile),
+        dibatasi nilai maksimum yang pernah diobservasi.
+        """
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        estimate = self.buckets[-1]
+        for i, c in enumerate(counts):
+            if cumulative + c >= rank and c:
+                if i < len(self.buckets):
+                    lower = self.buckets[i - 1] if i else 0.0
+                    estimate = lower + (self.buckets[i] - lower) * (rank - cumulative) / c
+                else:
+                    estimate = maximum if maximum is not None else self.buckets[-1]
+                break
+            cumulative += c
+        return min(estimate, maximum) if maximum is not None else estimate
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, (counts, total_sum, count, _) in self.series():
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self.started = time.time()
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing  # Modul di-import ulang: pakai instance yang sama
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, fn, kind: str = "gauge", labelnames=()) -> Callback:
+        """Daftarkan (atau ganti) metric yang nilainya diambil dari fn() saat scrape."""
+        metric = Callback(name, help, fn, kind, labelnames)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self) -> list:
+        """Ringkasan untuk chat: histogram (n, avg, p50, p95) lalu counter/gauge."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Histogram):
+                for key, (counts, total_sum, count, maximum) in metric.series():
+                    if not count:
+                        continue
+                    label = f"{metric.name}[{','.join(key)}]" if key else metric.name
+                    lines.append(
+                        f"• {label}: n={count} avg={total_sum / count * 1000:.1f}ms "
+                        f"p50={metric.quantile(0.5, counts, count, maximum) * 1000:.1f}ms "
+                        f"p95={metric.quantile(0.95, counts, count, maximum) * 1000:.1f}ms "
+                        f"max={maximum * 1000:.1f}ms"
+                    )
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Histogram):
+                continue
+            for key, value in metric.items():
+                label = f"{metric.name}[{','.join(key)}]" if key else metric.name
+                lines.append(f"• {label}: {value:g}")
+        return lines
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+callback = REGISTRY.callback
+
+
+# --- HTTP endpoint (/metrics) ---
+def start_http_server(port: int = METRICS_PORT, host: str = METRICS_HOST, registry: Registry = REGISTRY):
+    """Jalankan endpoint Prometheus di daemon thread. Return server, atau None kalau port 0."""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            data = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"📈 Metrics di http://{host}:{port}/metrics")
+    return server
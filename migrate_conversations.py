@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Migrasi history conversation dari array JSON `conversations.messages`
+ke tabel per-message `conversation_messages`.
+
+1. Buat tabel & index (jalankan di Supabase SQL editor):
+       python migrate_conversations.py --sql
+2. Pindahkan data (aman dijalankan ulang; user yang sudah punya row hanya
+   ditambah message lama yang belum ada):
+       python migrate_conversations.py [--dry-run] [--keep-json]
+"""
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+from broadcast import connect_supabase
+
+MESSAGES_TABLE = "conversation_messages"
+BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "200"))
+
+SCHEMA_SQL = """\
+create table if not exists conversation_messages (
+    id bigint generated always as identity primary key,
+    user_id bigint not null,
+    role text not null,
+    content text not null,
+    tokens integer,
+    created_at timestamptz not null default now()
+);
+create index if not exists conversation_messages_user_created_idx
+    on conversation_messages (user_id, created_at desc);
+create index if not exists conversation_messages_created_idx
+    on conversation_messages (created_at);
+
+-- Row conversations baru tidak lagi mengirim kolom messages
+alter table conversations alter column messages set default '[]'::jsonb;
+alter table conversations alter column messages drop not null;
+"""
+
+
+def to_rows(user_id: int, messages: list, now: float) -> list:
+    """Array JSON -> row per message. Message tanpa timestamp diberi waktu berurutan sebelum `now`."""
+    rows = []
+    for i, msg in enumerate(messages):
+        content = msg.get("content")
+        if not msg.get("role") or content is None:
+            continue
+        ts = msg.get("timestamp") or now - (len(messages) - i) * 0.001
+        rows.append({
+            "user_id": user_id,
+            "role": msg["role"],
+            "content": content,
+            "tokens": msg.get("tokens") or max(1, len(content) // 4),
+            "created_at": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+        })
+    return rows
+
+
+def existing_rows(supabase, user_ids: list, page_size: int = 1000) -> dict:
+    """user_id -> row (role, content, created_at) yang sudah ada di tabel baru. Dipaging karena max-rows PostgREST."""
+    existing = {}
+    offset = 0
+    while True:
+        rows = (
+            supabase.table(MESSAGES_TABLE)
+            .select("user_id, role, content, created_at")
+            .in_("user_id", user_ids)
+            .order("id")
+            .range(offset, offset + page_size - 1)
+            .execute()
+            .data
+        )
+        for r in rows:
+            existing.setdefault(r["user_id"], []).append(r)
+        if len(rows) < page_size:
+            return existing
+        offset += page_size
+
+
+def missing_rows(user_id: int, messages: list, rows: list) -> list:
+    """
+    Message JSON yang belum ada di `rows` (row milik user yang sudah chat
+    pakai tabel baru, atau sisa run sebelumnya yang terputus). Dicocokkan per
+    (role, content); message tanpa timestamp ditaruh sebelum row paling lama.
+    """
+    have = Counter((r["role"], r["content"]) for r in rows)
+    oldest = min(datetime.fromisoformat(r["created_at"]).timestamp() for r in rows)
+    missing = []
+    for row in to_rows(user_id, messages, oldest):
+        key = (row["role"], row["content"])
+        if have[key]:
+            have[key] -= 1
+        else:
+            missing.append(row)
+    return missing
+
+
+def migrate(supabase, batch_size: int = BATCH_SIZE, dry_run: bool = False, keep_json: bool = False) -> dict:
+    stats = {"users": 0, "migrated_users": 0, "merged_users": 0, "messages": 0}
+    last_id = None
+    while True:
+        query = (
+            supabase.table("conversations")
+            .select("user_id, messages")
+            .order("user_id")
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.gt("user_id", last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        last_id = rows[-1]["user_id"]
+        stats["users"] += len(rows)
+
+        pending = [r for r in rows if r.get("messages")]
+        if pending:
+            # User yang sudah punya row (chat pakai kode baru, atau run sebelumnya
+            # terputus): hanya message lama yang belum ada yang di-insert
+            existing = existing_rows(supabase, [r["user_id"] for r in pending])
+            now = time.time()
+            inserts = []
+            for row in pending:
+                if row["user_id"] in existing:
+                    inserts.extend(missing_rows(row["user_id"], row["messages"], existing[row["user_id"]]))
+                    stats["merged_users"] += 1
+                else:
+                    inserts.extend(to_rows(row["user_id"], row["messages"], now))
+                    stats["migrated_users"] += 1
+
+            if not dry_run:
+                if inserts:
+                    supabase.table(MESSAGES_TABLE).insert(inserts, returning="minimal").execute()
+                if not keep_json:
+                    # Kosongkan array lama setelah semua message-nya aman di tabel baru
+                    supabase.table("conversations").upsert(
+                        [{"user_id": r["user_id"], "messages": []} for r in pending]
+                    ).execute()
+            stats["messages"] += len(inserts)
+
+        print(f"🔁 {stats['users']} user discan, {stats['messages']} message dipindah")
+        if len(rows) < batch_size:
+            break
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sql", action="store_true", help="print DDL tabel & index lalu keluar")
+    parser.add_argument("--dry-run", action="store_true", help="hitung saja, tidak menulis apa-apa")
+    parser.add_argument("--keep-json", action="store_true", help="jangan kosongkan conversations.messages")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.sql:
+        print(SCHEMA_SQL)
+        return
+    supabase = connect_supabase()
+    if not supabase:
+        sys.exit("❌ SUPABASE_URL / SUPABASE_KEY belum di-set")
+    stats = migrate(supabase, args.batch_size, args.dry_run, args.keep_json)
+    print(
+        f"✅ Selesai{' (dry run)' if args.dry_run else ''}: {stats['migrated_users']} user, "
+        f"{stats['messages']} message dipindah, {stats['merged_users']} user digabung dengan row yang sudah ada"
+    )
+
+
+if __name__ == "__main__":
+    main()
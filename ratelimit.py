@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Shared in-memory rate limiter untuk semua bot (Groq, Gemini, Ollama).
+
+Setiap user punya token bucket kecil (pakai __slots__) jadi cek limit O(1)
+tanpa sentuh disk. State di-snapshot ke file secara periodik (atomic write),
+dan user non-premium yang bucket-nya sudah penuh lagi di-evict dari memori.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+
+
+class UserBucket:
+    """Token bucket per user. tokens = sisa prompt yang boleh dipakai."""
+
+    __slots__ = ("tokens", "updated", "premium")
+
+    def __init__(self, tokens: float, updated: float, premium: bool = False):
+        self.tokens = tokens
+        self.updated = updated
+        self.premium = premium
+
+
+class RateLimiter:
+    """
+    Token bucket: kapasitas `limit` prompt, refill penuh dalam `window` detik.
+    check() mengembalikan (ok, used) sama seperti can_use() lama.
+    """
+
+    def __init__(self, limit: int = 30, window: int = 1800, path: str = None,
+                 admin: str = None, snapshot_interval: int = 60):
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window  # token per detik
+        self.path = path
+        self.admin = admin
+        self.snapshot_interval = snapshot_interval
+        self._users = {}  # uid (int) -> UserBucket
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._mtime = None  # mtime file setelah load/snapshot terakhir kita
+
+    def _refill(self, b: UserBucket, now: float):
+        if b.tokens < self.limit:
+            b.tokens = min(self.limit, b.tokens + (now - b.updated) * self.rate)
+        b.updated = now
+
+    def check(self, uid, name=None, now: float = None) -> tuple[bool, int]:
+        """Cek dan konsumsi 1 token. O(1)."""
+        now = time.time() if now is None else now
+        uid = int(uid)
+        with self._lock:
+            b = self._users.get(uid)
+            if b is None:
+                b = self._users[uid] = UserBucket(self.limit, now)
+            else:
+                self._refill(b, now)
+
+            if self.admin and name == self.admin and not b.premium:
+                b.premium = True
+            self._dirty = True
+
+            if b.premium:
+                return True, int(self.limit - b.tokens)
+
+            if b.tokens < 1:
+                return False, self.limit
+
+            b.tokens -= 1
+            return True, int(self.limit - b.tokens)
+
+    def set_premium(self, uid, premium: bool = True):
+        with self._lock:
+            b = self._users.get(int(uid))
+            if b is None:
+                b = self._users[int(uid)] = UserBucket(self.limit, time.time())
+            b.premium = premium
+            self._dirty = True
+
+    def is_premium(self, uid) -> bool:
+        b = self._users.get(int(uid))
+        return bool(b and b.premium)
+
+    def refund(self, uid):
+        """Kembalikan 1 token (request ditolak sebelum sempat diproses, mis. server sibuk)."""
+        with self._lock:
+            b = self._users.get(int(uid))
+            if b is not None and not b.premium:
+                b.tokens = min(self.limit, b.tokens + 1)
+                self._dirty = True
+
+    def evict_expired(self, now: float = None) -> int:
+        """Hapus user non-premium yang bucket-nya sudah penuh (window habis)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [
+                uid for uid, b in self._users.items()
+                if not b.premium and (b.tokens >= self.limit or now - b.updated >= self.window)
+            ]
+            for uid in stale:
+                del self._users[uid]
+            if stale:
+                self._dirty = True
+        return len(stale)
+
+    def __len__(self):
+        return len(self._users)
+
+    # --- persistence ---
+    def _read_file(self, now: float) -> dict:
+        """Baca snapshot -> {uid: UserBucket}. Format lama users.json ({count, reset, premium}) juga didukung."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        users = {}
+        for uid, v in data.items():
+            try:
+                if isinstance(v, list):
+                    tokens, updated, premium = v
+                else:
+                    # Format lama: count di window yang reset pada `reset`
+                    count = v.get("count", 0) if v.get("reset", 0) > now else 0
+                    tokens, updated, premium = self.limit - count, now, v.get("premium", False)
+                users[int(uid)] = UserBucket(float(tokens), float(updated), bool(premium))
+            except (TypeError, ValueError, AttributeError):
+                continue
+        return users
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        """Load snapshot dari disk (saat start)."""
+        if not self.path:
+            return
+        mtime = self._file_mtime()
+        users = self._read_file(time.time())
+        with self._lock:
+            self._users = users
+            self._mtime = mtime
+
+    def reload_premium(self) -> int:
+        """
+        Kalau file diubah dari luar (mis. premium di-set manual di users.json),
+        ambil status premium dari file sebelum snapshot berikutnya menimpanya.
+        Return jumlah user yang status premiumnya berubah.
+        """
+        if not self.path:
+            return 0
+        mtime = self._file_mtime()
+        if mtime is None or mtime == self._mtime:
+            return 0
+        now = time.time()
+        users = self._read_file(now)
+        changed = 0
+        with self._lock:
+            for uid, fb in users.items():
+                b = self._users.get(uid)
+                if b is None:
+                    if fb.premium:
+                        self._users[uid] = UserBucket(self.limit, now, True)
+                        changed += 1
+                elif b.premium != fb.premium:
+                    b.premium = fb.premium
+                    changed += 1
+            if changed:
+                self._dirty = True
+            self._mtime = mtime
+        if changed:
+            print(f"💎 {changed} status premium diambil dari {self.path}")
+        return changed
+
+    def snapshot(self):
+        """Tulis state ke disk secara atomic (tmp file + os.replace)."""
+        if not self.path:
+            return
+        # Lock hanya untuk copy list; serialisasi di luar supaya check() tidak tertahan
+        with self._lock:
+            if not self._dirty:
+                return
+            items = list(self._users.items())
+            self._dirty = False
+        data = {str(uid): [round(b.tokens, 3), round(b.updated, 1), b.premium] for uid, b in items}
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._mtime = self._file_mtime()
+        except OSError as e:
+            self._dirty = True
+            print(f"⚠️ Rate limit snapshot error: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self.reload_premium()
+            self.evict_expired()
+            self.snapshot()
+
+    def start(self):
+        """Load snapshot lalu jalankan thread snapshot + eviction periodik."""
+        self.load()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="ratelimit-snapshot", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.snapshot()
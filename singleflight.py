@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Single-flight: request identik yang datang bersamaan cukup satu panggilan upstream.
+
+- `SingleFlight.do(key, factory)`: coroutine biasa (mis. web search); pemanggil
+  kedua dst. menunggu hasil yang sama.
+- `SingleFlight.stream(key, factory)`: async iterator (streaming LLM); setiap
+  subscriber dapat semua chunk dari awal lalu mengikuti chunk baru, jadi semua
+  pesan yang menunggu tetap ter-update bertahap.
+
+Key dihapus begitu upstream selesai, jadi request unik tidak menunggu apa-apa
+dan hasil lama tidak pernah dipakai ulang (itu tugas cache).
+"""
+
+import asyncio
+
+
+class SharedStream:
+    """Satu upstream stream, banyak subscriber."""
+
+    def __init__(self, source):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self):
+        self.subscribers += 1
+        i = 0
+        while True:
+            if i < len(self.chunks):
+                i += 1
+                yield self.chunks[i - 1]
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._inflight = {}
+        self.stats = {"leader": 0, "shared": 0}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def _track(self, key, task, value):
+        self._inflight[key] = value
+
+        def cleanup(_):
+            if self._inflight.get(key) is value:
+                del self._inflight[key]
+
+        task.add_done_callback(cleanup)
+
+    async def do(self, key, factory):
+        """Jalankan `factory()` (coroutine) sekali per key yang sedang in-flight."""
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["leader"] += 1
+            task = asyncio.ensure_future(factory())
+            self._track(key, task, task)
+        else:
+            self.stats["shared"] += 1
+        # shield: pemanggil yang batal tidak membatalkan pemanggil lain
+        return await asyncio.shield(task)
+
+    def stream(self, key, factory):
+        """
+        Return async iterator chunk untuk key ini. `factory()` (async iterator)
+        hanya dipanggil kalau belum ada stream in-flight dengan key yang sama.
+        """
+        shared = self._inflight.get(key)
+        if shared is None:
+            self.stats["leader"] += 1
+            shared = SharedStream(factory())
+            self._track(key, shared.task, shared)
+        else:
+            self.stats["shared"] += 1
+        return shared.subscribe()
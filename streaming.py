@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Streaming jawaban LLM ke satu pesan Telegram lewat edit_message_text.
+
+Dipakai bareng oleh bot-groq.py, bot-gemini.py dan bot-ollama.py: teks dari
+async iterator dikumpulkan, lalu pesan di-edit secukupnya (EditCoalescer)
+supaya tidak kena flood limit Telegram.
+"""
+
+import os
+import time
+import asyncio
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from formatting import strip_markdown
+import metrics
+
+# --- Edit coalescer untuk streaming ke Telegram ---
+# Telegram flood limit: ~1 edit/detik per chat, ~20 pesan/menit di grup
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_EDIT_INTERVAL_GROUP = float(os.getenv("STREAM_EDIT_INTERVAL_GROUP", "3.0"))
+STREAM_CURSOR = " ▌"
+_chat_next_edit = {}  # chat_id -> waktu (monotonic) paling cepat boleh edit lagi
+
+EDIT_SECONDS = metrics.histogram(
+    "bot_telegram_edit_seconds", "Durasi edit_message_text (partial = streaming, final = jawaban akhir)", ("kind",)
+)
+EDIT_RESULTS = metrics.counter(
+    "bot_telegram_edits_total", "Hasil edit_message_text", ("kind", "result")
+)
+
+
+class EditCoalescer:
+    """
+    Gabungkan banyak update teks jadi sedikit edit_message_text.
+    Slot edit dibagi per chat (bukan per pesan), jadi beberapa stream di grup
+    yang sama tetap di bawah flood limit. Edit dengan isi sama di-skip.
+    """
+
+    def __init__(self, bot, message):
+        self.bot = bot
+        self.chat_id = message.chat.id
+        self.message_id = message.message_id
+        is_group = message.chat.type in ("group", "supergroup", "channel")
+        self.interval = STREAM_EDIT_INTERVAL_GROUP if is_group else STREAM_EDIT_INTERVAL
+        self.last_text = None
+        self.edits = 0
+
+    def ready(self) -> bool:
+        return time.monotonic() >= _chat_next_edit.get(self.chat_id, 0)
+
+    async def update(self, text: str):
+        """Edit kalau slot chat sudah kosong; kalau belum, skip (teks berikutnya menyusul)."""
+        if text != self.last_text and self.ready():
+            await self._edit(text)
+
+    async def finish(self, text: str):
+        """
+        Edit terakhir wajib terkirim: tunggu slot / RetryAfter / timeout jaringan
+        lalu coba lagi. Kalau percobaan terakhir masih gagal jaringan, error di-raise.
+        """
+        attempts = 3
+        for attempt in range(attempts):
+            if text == self.last_text:
+                return
+            wait = _chat_next_edit.get(self.chat_id, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                if await self._edit(text, final=True):
+                    return
+            except NetworkError:
+                if attempt == attempts - 1:
+                    raise
+
+    async def _edit(self, text: str, final: bool = False) -> bool:
+        kind = "final" if final else "partial"
+        now = time.monotonic()
+        _chat_next_edit[self.chat_id] = now + self.interval
+        if len(_chat_next_edit) > 10000:
+            for cid in [c for c, t in _chat_next_edit.items() if t < now]:
+                del _chat_next_edit[cid]
+        try:
+            with EDIT_SECONDS.time(kind=kind):
+                await self.bot.edit_message_text(
+                    chat_id=self.chat_id,
+                    message_id=self.message_id,
+                    text=text
+                )
+        except RetryAfter as e:
+            retry = e.retry_after
+            seconds = retry.total_seconds() if hasattr(retry, "total_seconds") else float(retry)
+            _chat_next_edit[self.chat_id] = time.monotonic() + seconds
+            EDIT_RESULTS.inc(kind=kind, result="retry_after")
+            return False
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                print(f"Edit message error: {e}")
+                EDIT_RESULTS.inc(kind=kind, result="error")
+                return False
+        except TelegramError as e:
+            # TimedOut / NetworkError: edit parsial cuma kosmetik, lanjut streaming.
+            # Edit final di-raise supaya finish() bisa retry.
+            EDIT_RESULTS.inc(kind=kind, result="error")
+            if final:
+                raise
+            print(f"Edit message error: {e}")
+            return False
+        EDIT_RESULTS.inc(kind=kind, result="ok")
+        self.last_text = text
+        self.edits += 1
+        return True
+
+
+class ReplayText:
+    """Jawaban yang sudah lengkap (mis. dari cache), dipakai sebagai async iterator satu chunk."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    async def __aiter__(self):
+        yield self.text
+
+
+async def stream_chunks_to_message(chunks, message, bot) -> tuple:
+    """
+    Stream potongan teks dari async iterator `chunks` ke pesan 'sedang berpikir...'.
+    Returns: (full_reply mentah, coalescer) - panggil coalescer.finish() untuk edit final.
+    """
+    coalescer = EditCoalescer(bot, message)
+    if isinstance(chunks, ReplayText):
+        # Sudah lengkap: tidak perlu edit parsial, langsung edit final
+        return chunks.text.strip(), coalescer
+    parts = []
+    async for delta in chunks:
+        parts.append(delta)
+        if coalescer.ready():
+            partial = strip_markdown("".join(parts))
+            if partial:
+                await coalescer.update(partial[:4000 - len(STREAM_CURSOR)] + STREAM_CURSOR)
+    return "".join(parts).strip(), coalescer
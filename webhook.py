@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Mode webhook sebagai pengganti run_polling (aktif kalau WEBHOOK_URL di-set).
+
+Server HTTP asyncio kecil (stdlib) di satu port:
+- POST WEBHOOK_PATH : update dari Telegram, dicek header secret token,
+                      masuk ke update_queue PTB (dibatasi WEBHOOK_QUEUE_SIZE;
+                      kalau penuh balas 503 supaya Telegram retry nanti)
+- GET  /healthz     : health check untuk load balancer
+- GET  /metrics     : metrics Prometheus (sama dengan METRICS_PORT)
+
+Semua instance memanggil setWebhook dengan URL & secret yang sama, jadi
+beberapa instance bisa jalan di belakang satu load balancer.
+"""
+
+import os
+import hmac
+import json
+import time
+import signal
+import asyncio
+import hashlib
+from telegram import Update
+
+import metrics
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # base URL publik, mis. https://xxx.koyeb.app
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8080")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_MAX_CLIENTS = int(os.getenv("WEBHOOK_MAX_CLIENTS", "100"))  # koneksi TCP terbuka bareng
+WEBHOOK_READ_TIMEOUT = float(os.getenv("WEBHOOK_READ_TIMEOUT", "10"))  # batas baca header / body / kirim respon
+MAX_BODY_SIZE = 1024 * 1024
+MAX_HEADERS = 100
+KEEPALIVE_TIMEOUT = 75
+
+WEBHOOK_REQUESTS = metrics.counter(
+    "bot_webhook_requests_total", "Request HTTP ke server webhook", ("route", "status")
+)
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+
+def webhook_enabled() -> bool:
+    return bool(WEBHOOK_URL)
+
+
+def default_secret(token: str) -> str:
+    """Secret turunan dari token bot: sama di semua instance tanpa perlu config tambahan."""
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest()
+
+
+class WebhookServer:
+    def __init__(self, application, path: str = WEBHOOK_PATH, secret: str = None,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, max_clients: int = WEBHOOK_MAX_CLIENTS):
+        self.application = application
+        self.path = path
+        self.secret = secret or default_secret(application.bot.token)
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.clients = 0
+        self.started = time.time()
+        self._server = None
+
+    async def start(self, host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- HTTP/1.1 minimal (Content-Length, keep-alive) ---
+    # Setiap baca/tulis dibatasi waktu (client lambat tidak menahan koneksi
+    # selamanya) dan jumlah koneksi terbuka dibatasi max_clients.
+    async def _handle_connection(self, reader, writer):
+        if self.clients >= self.max_clients:
+            WEBHOOK_REQUESTS.inc(route="other", status=503)
+            try:
+                await self._respond(writer, 503, b"too many connections", close=True)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            writer.close()
+            return
+        self.clients += 1
+        try:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_TIMEOUT)
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, b"bad request", close=True)
+                    break
+
+                headers = await asyncio.wait_for(self._read_headers(reader), timeout=WEBHOOK_READ_TIMEOUT)
+                if headers is None:
+                    await self._respond(writer, 431, b"too many headers", close=True)
+                    break
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._respond(writer, 411, b"content-length required", close=True)
+                    break
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._respond(writer, 400, b"bad content-length", close=True)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, b"too large", close=True)
+                    break
+                body = b""
+                if length:
+                    body = await asyncio.wait_for(reader.readexactly(length), timeout=WEBHOOK_READ_TIMEOUT)
+
+                status, payload, content_type = await self.route(method, target.split("?", 1)[0], headers, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, content_type, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except ValueError:
+            # readline() melebihi limit StreamReader (64 KiB per baris)
+            try:
+                await self._respond(writer, 431, b"line too long", close=True)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader):
+        """Header sampai baris kosong; None kalau lebih dari MAX_HEADERS."""
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > MAX_HEADERS:
+                return None
+
+    async def _respond(self, writer, status: int, payload: bytes,
+                       content_type: str = "text/plain; charset=utf-8", close: bool = False):
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await asyncio.wait_for(writer.drain(), timeout=WEBHOOK_READ_TIMEOUT)
+
+    # --- routes ---
+    async def route(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if path == self.path:
+            status, payload = self._receive_update(method, headers, body)
+            WEBHOOK_REQUESTS.inc(route="webhook", status=status)
+            return status, payload, "text/plain; charset=utf-8"
+        if path == "/healthz" and method == "GET":
+            return self._health()
+        if path == "/metrics" and method == "GET":
+            return 200, metrics.REGISTRY.render().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        WEBHOOK_REQUESTS.inc(route="other", status=404)
+        return 404, b"not found", "text/plain; charset=utf-8"
+
+    def _receive_update(self, method: str, headers: dict, body: bytes) -> tuple:
+        if method != "POST":
+            return 405, b"method not allowed"
+        token = headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            return 403, b"forbidden"
+        queue = self.application.update_queue
+        if queue.qsize() >= self.queue_size:
+            # Antrian penuh: Telegram akan kirim ulang update ini nanti
+            return 503, b"busy"
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400, b"bad update"
+        queue.put_nowait(update)
+        return 200, b"ok"
+
+    def _health(self) -> tuple:
+        running = self.application.running
+        body = json.dumps({
+            "status": "ok" if running else "starting",
+            "queue": self.application.update_queue.qsize(),
+            "uptime": int(time.time() - self.started),
+        }).encode()
+        return (200 if running else 503), body, "application/json"
+
+
+async def _serve_webhook(application, url: str, secret: str, host: str, port: int):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = None
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        server = WebhookServer(application, secret=secret)
+        await server.start(host, port)
+        await application.bot.set_webhook(
+            url=url + server.path,
+            secret_token=server.secret,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        await application.start()
+        print(f"🌐 Webhook aktif di {host}:{port}{server.path} (health: /healthz)")
+        await stop.wait()
+    finally:
+        if server:
+            await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application, url: str = WEBHOOK_URL, secret: str = WEBHOOK_SECRET,
+                host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+    """Pengganti application.run_polling() untuk mode webhook (blocking sampai SIGINT/SIGTERM)."""
+    asyncio.run(_serve_webhook(application, url, secret, host, port))
+
+
+def run(application):
+    """Webhook kalau WEBHOOK_URL di-set, selain itu long polling seperti biasa."""
+    if webhook_enabled():
+        run_webhook(application)
+    else:
+        application.run_polling()